@@ -1,10 +1,12 @@
-# Local imports
-from gomoku.window import GomokuWindow
 # Module imports
-from PySide6.QtWidgets import QApplication
 import sys
 
 def main():
+    # Qt is imported here rather than at the top, as processes
+    # spawned for parallel search import this module again
+    from PySide6.QtWidgets import QApplication
+    from gomoku.window import GomokuWindow
+
     # Pass command-line arguments to QApplication
     app = QApplication(sys.argv)
 
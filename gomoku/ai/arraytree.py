@@ -0,0 +1,203 @@
+# Local imports
+from gomoku.ai.mcts import BOARD_SIZE
+# Module imports
+from array import array
+import math
+import random
+import time
+
+# Default maximum number of nodes stored in a tree
+NODE_CAPACITY = 1000000
+
+class ArrayTree:
+    # MCTS tree stored in flat arrays indexed by node id, instead of
+    # one MCTSNode object per node. Children of a node are stored
+    # next to each other, and states are recomputed by replaying
+    # moves from the root instead of being stored in each node
+    def __init__(self, state, capacity=NODE_CAPACITY):
+        self.rootState = state.clone()
+        self.capacity = capacity
+        self.allocate()
+
+        # Node 0 is the root
+        self.size = 1
+
+    def allocate(self):
+        cap = self.capacity
+        self.visits = array("i", [0]) * cap
+        self.wins = array("i", [0]) * cap
+        self.moves = array("H", [0]) * cap
+        # Index of first child, -1 when not expanded
+        self.firstChild = array("i", [-1]) * cap
+        self.childCount = array("H", [0]) * cap
+        # Children before this offset have been visited
+        self.nextUntried = array("H", [0]) * cap
+
+    def __len__(self):
+        return self.size
+
+    def expand(self, node, state):
+        # Add every legal move as a child, in random order so that
+        # unvisited children are tried in a random order
+        moves = []
+        state.removeForbidden()
+        legal = state.legalMoves
+        while legal:
+            move = (legal & -legal).bit_length() - 1
+            moves.append(move)
+            legal &= legal - 1
+        random.shuffle(moves)
+
+        if self.size + len(moves) > self.capacity:
+            # Tree is still full, leave this node as a leaf
+            return False
+
+        first = self.size
+        for i, move in enumerate(moves):
+            child = first + i
+            self.visits[child] = 0
+            self.wins[child] = 0
+            self.moves[child] = move
+            self.firstChild[child] = -1
+            self.childCount[child] = 0
+            self.nextUntried[child] = 0
+        self.firstChild[node] = first
+        self.childCount[node] = len(moves)
+        self.nextUntried[node] = 0
+        self.size += len(moves)
+        return True
+
+    def uctSelectChild(self, node, exploration=math.sqrt(2)):
+        visits = self.visits
+        wins = self.wins
+        logN = math.log(visits[node])
+        first = self.firstChild[node]
+        best = first
+        bestValue = -1
+        for child in range(first, first + self.childCount[node]):
+            n = visits[child]
+            value = wins[child] / n + exploration * math.sqrt(logN / n)
+            if value > bestValue:
+                best = child
+                bestValue = value
+        return best
+
+    def search(self, iterations=None, deadline=None, stop=None):
+        # Same budgets as mcts, deadline is compared to time.perf_counter
+        if iterations is None and deadline is None:
+            raise Exception("search requires an iteration count or deadline")
+
+        count = 0
+        while True:
+            # Prune between iterations, as node ids change
+            if self.size + BOARD_SIZE*BOARD_SIZE > self.capacity:
+                self.prune()
+
+            node = 0
+            state = self.rootState.clone()
+            # Pairs of node and the player who moved into it
+            path = [(0, 3 - state.currentPlayer)]
+
+            # Selection
+            while self.firstChild[node] != -1 and not state.isTerminal():
+                if self.nextUntried[node] < self.childCount[node]:
+                    # Expansion of a child that has not been visited
+                    child = self.firstChild[node] + self.nextUntried[node]
+                    self.nextUntried[node] += 1
+                    path.append((child, state.currentPlayer))
+                    state.makeMove(self.moves[child], False)
+                    node = child
+                    break
+                node = self.uctSelectChild(node)
+                path.append((node, state.currentPlayer))
+                # Forbidden moves are only filtered out when expanding
+                state.makeMove(self.moves[node], False)
+            else:
+                # Reached a leaf, expand it on its first revisit
+                if not state.isTerminal() and (node == 0 or self.visits[node]):
+                    if self.expand(node, state):
+                        child = self.firstChild[node]
+                        self.nextUntried[node] = 1
+                        path.append((child, state.currentPlayer))
+                        state.makeMove(self.moves[child], False)
+
+            # Simulation
+            while not state.isTerminal():
+                state.explore()
+
+            # Backpropagation
+            result = state.overallWinner
+            for node, player in path:
+                self.visits[node] += 1
+                if result == player:
+                    self.wins[node] += 1
+
+            count += 1
+            if iterations is not None and count >= iterations:
+                break
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+            if stop is not None and stop.is_set():
+                break
+
+        return self.bestMove()
+
+    def children(self, node=0):
+        first = self.firstChild[node]
+        if first == -1:
+            return range(0)
+        return range(first, first + self.childCount[node])
+
+    def bestMove(self):
+        best = max(self.children(), key=lambda child: self.visits[child])
+        return self.moves[best]
+
+    def copySubtree(self, root, minVisits):
+        # Copy the subtree below root into new arrays, only keeping the
+        # children of nodes with at least minVisits visits
+        old = (self.visits, self.wins, self.moves,
+               self.firstChild, self.childCount, self.nextUntried)
+        oldVisits, oldWins, oldMoves, oldFirst, oldCount, oldUntried = old
+        self.allocate()
+
+        self.visits[0] = oldVisits[root]
+        self.wins[0] = oldWins[root]
+        self.moves[0] = oldMoves[root]
+        size = 1
+        queue = [(root, 0)]
+        for oldNode, newNode in queue:
+            first = oldFirst[oldNode]
+            if first == -1 or (oldNode != root and oldVisits[oldNode] < minVisits):
+                # Turn into a leaf, children are added again if revisited
+                continue
+            count = oldCount[oldNode]
+            self.firstChild[newNode] = size
+            self.childCount[newNode] = count
+            self.nextUntried[newNode] = oldUntried[oldNode]
+            for i in range(count):
+                self.visits[size + i] = oldVisits[first + i]
+                self.wins[size + i] = oldWins[first + i]
+                self.moves[size + i] = oldMoves[first + i]
+                queue.append((first + i, size + i))
+            size += count
+        self.size = size
+
+    def prune(self):
+        # Recycle space by dropping the subtrees of rarely visited
+        # nodes, raising the threshold until half the space is free
+        minVisits = 2
+        while True:
+            self.copySubtree(0, minVisits)
+            if self.size <= self.capacity // 2 or minVisits > self.visits[0]:
+                break
+            minVisits *= 2
+
+    def advance(self, move):
+        # Make the child reached by move the new root
+        self.rootState.makeMove(move)
+        for child in self.children():
+            if self.moves[child] == move:
+                self.copySubtree(child, 0)
+                return
+        self.allocate()
+        self.size = 1
@@ -0,0 +1,178 @@
+# Local imports
+from gomoku.ai.mcts import BOARD_SIZE, CENTRE, lineDirections
+# Module imports
+import numpy as np
+import random
+
+CELLS = BOARD_SIZE * BOARD_SIZE
+# Bytes needed to hold one bitboard
+BITBOARD_BYTES = (CELLS + 7) // 8
+
+# Default number of games simulated from each leaf
+BATCH_GAMES = 256
+
+def unpackPieces(pieces):
+    # Convert a bitboard into a flat array of booleans
+    data = np.frombuffer(pieces.to_bytes(BITBOARD_BYTES, "little"), dtype=np.uint8)
+    return np.unpackbits(data, bitorder="little")[:CELLS].astype(bool)
+
+def stateToBoard(state):
+    # 15x15 array of 0 (empty), 1 or 2 as in gomoku.board.Board
+    board = np.zeros(CELLS, dtype=np.int8)
+    board[unpackPieces(state.pieces1)] = 1
+    board[unpackPieces(state.pieces2)] = 2
+    return board.reshape(BOARD_SIZE, BOARD_SIZE)
+
+def legalMoves(occupied):
+    # Empty cells next to a piece, for a stack of boards, matching
+    # GomokuState.calculateLegalMoves
+    padded = np.pad(occupied, ((0, 0), (1, 1), (1, 1)))
+    near = np.zeros_like(occupied)
+    for dy in range(3):
+        for dx in range(3):
+            near |= padded[:, dy:dy+BOARD_SIZE, dx:dx+BOARD_SIZE]
+    legal = near & ~occupied
+
+    # Empty boards can only be played in the centre
+    empty = ~occupied.any(axis=(1, 2))
+    legal[empty, CENTRE // BOARD_SIZE, CENTRE % BOARD_SIZE] = True
+    return legal
+
+# Boards have an extra cell past the end that stands for off the
+# board, holding a value that is neither player and never empty
+OFF_BOARD = CELLS
+OFF_VALUE = 3
+
+def makeNeighbours():
+    # The 8 cells around each cell
+    neighbours = np.full((CELLS, 8), OFF_BOARD, dtype=np.intp)
+    for cell in range(CELLS):
+        x, y = cell % BOARD_SIZE, cell // BOARD_SIZE
+        i = 0
+        for dy in (-1, 0, 1):
+            for dx in (-1, 0, 1):
+                if not dx and not dy:
+                    continue
+                if 0 <= x + dx < BOARD_SIZE and 0 <= y + dy < BOARD_SIZE:
+                    neighbours[cell, i] = BOARD_SIZE*(y + dy) + x + dx
+                i += 1
+    return neighbours
+
+def makeLines():
+    # The cells up to 4 away from each cell along each line,
+    # in order, so a five through the cell is 5 cells in a row
+    lines = np.full((CELLS, 4, 9), OFF_BOARD, dtype=np.intp)
+    for cell in range(CELLS):
+        x, y = cell % BOARD_SIZE, cell // BOARD_SIZE
+        for line, (dx, dy) in enumerate(lineDirections):
+            for i in range(-4, 5):
+                cx, cy = x + i*dx, y + i*dy
+                if 0 <= cx < BOARD_SIZE and 0 <= cy < BOARD_SIZE:
+                    lines[cell, line, i + 4] = BOARD_SIZE*cy + cx
+    return lines
+
+neighbourCells = makeNeighbours()
+lineCells = makeLines()
+
+def simulate(boards, players, rng):
+    # Play random games on every board at once, where players holds
+    # the player to move on each board. Returns the winner of each
+    # game, 0 for a draw. Only the cells around each move are looked
+    # at to update the legal moves and test for a win, and finished
+    # games are dropped in bulk rather than after every move
+    count = len(boards)
+    cells = np.full((count, CELLS + 1), OFF_VALUE, dtype=np.int8)
+    cells[:, :CELLS] = boards.reshape(count, CELLS)
+    legal = np.zeros((count, CELLS + 1), dtype=bool)
+    legal[:, :CELLS] = legalMoves(boards != 0).reshape(count, CELLS)
+    legalCount = legal.sum(axis=1)
+    players = players.astype(np.int8)
+    winners = np.zeros(count, dtype=np.int8)
+
+    # Game played on each row, and whether it has finished
+    games = np.arange(count)
+    done = np.zeros(count, dtype=bool)
+    while True:
+        # Full boards are draws
+        done |= legalCount == 0
+        finished = np.count_nonzero(done)
+        if finished == len(games):
+            break
+        if finished * 4 >= len(games):
+            # Finished games still have moves played in them until
+            # enough have finished to be worth copying the rest
+            keep = ~done
+            cells = cells[keep]
+            legal = legal[keep]
+            legalCount = legalCount[keep]
+            players = players[keep]
+            games = games[keep]
+            done = done[keep]
+        rows = np.arange(len(games))[:, None]
+
+        # Uniformly random legal move for every game, as
+        # legal cells have keys from 1 up and the rest below 1
+        keys = rng.random(legal.shape, dtype=np.float32)
+        keys += legal
+        moves = keys.argmax(axis=1)
+        cells[rows[:, 0], moves] = players
+        legal[rows[:, 0], moves] = False
+
+        # Empty cells around the move become legal
+        near = neighbourCells[moves]
+        added = (cells[rows, near] == 0) & ~legal[rows, near]
+        legal[rows, near] |= added
+        legalCount += added.sum(axis=1) - 1
+
+        # Only the player who just moved can have won,
+        # with five in a row through the move
+        line = cells[rows[:, :, None], lineCells[moves]] == players[:, None, None]
+        five = line[:, :, 0:5].copy()
+        for i in range(1, 5):
+            five &= line[:, :, i:i+5]
+        won = five.any(axis=(1, 2)) & ~done
+        winners[games[won]] = players[won]
+        done |= won
+        players = 3 - players
+
+    return winners
+
+def simulateStates(states, games=1):
+    # Results of random games from several leaves at once,
+    # as a (games, wins1, wins2) tuple for each state
+    results = [None] * len(states)
+    live = []
+    for i, state in enumerate(states):
+        if state.isTerminal():
+            # Nothing to simulate
+            winner = state.overallWinner
+            results[i] = (games, games * (winner == 1), games * (winner == 2))
+        else:
+            live.append(i)
+    if not live:
+        return results
+
+    boards = np.concatenate([
+        np.repeat(stateToBoard(states[i])[None], games, axis=0) for i in live
+    ])
+    players = np.repeat(
+        np.array([states[i].currentPlayer for i in live], dtype=np.int8), games)
+    # Seed from random so reseeded worker processes differ
+    rng = np.random.default_rng(random.getrandbits(64))
+    winners = simulate(boards, players, rng).reshape(len(live), games)
+    for i, w in zip(live, winners):
+        results[i] = (
+            games,
+            int(np.count_nonzero(w == 1)),
+            int(np.count_nonzero(w == 2)),
+        )
+    return results
+
+class BatchRollout:
+    # Rollout for mcts that simulates many games from each leaf
+    # with NumPy instead of playing one GomokuState at a time
+    def __init__(self, games=BATCH_GAMES):
+        self.games = games
+
+    def __call__(self, state):
+        return simulateStates([state], self.games)[0]
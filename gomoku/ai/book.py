@@ -0,0 +1,208 @@
+# Local imports
+from gomoku.ai.mcts import BOARD_SIZE, GomokuState, zobrist
+from gomoku.ai.engine import Engine
+from gomoku.ai.threats import bits
+# Module imports
+import argparse
+import mmap
+import os
+import random
+import struct
+
+CELLS = BOARD_SIZE * BOARD_SIZE
+
+# Default location of the book used by MCTSWorker, outside the
+# package as it may be installed somewhere read-only
+BOOK_PATH = os.path.join(os.path.expanduser("~"), ".gomoku", "opening.book")
+# Only positions with fewer pieces than this are stored
+BOOK_PLIES = 10
+
+# File layout: magic and record count, then records sorted by key.
+# Keys use the Zobrist keys in gomoku.ai.mcts, so books must be
+# rebuilt if those ever change
+MAGIC = b"GBK1"
+HEADER = struct.Struct("<4sI")
+# Position key, move and weight
+RECORD = struct.Struct("<QHI")
+
+def transformCell(cell, symmetry):
+    # Apply one of the 8 symmetries of the square board,
+    # bits of symmetry select flip x, flip y and transpose
+    x, y = cell % BOARD_SIZE, cell // BOARD_SIZE
+    if symmetry & 1:
+        x = BOARD_SIZE - 1 - x
+    if symmetry & 2:
+        y = BOARD_SIZE - 1 - y
+    if symmetry & 4:
+        x, y = y, x
+    return BOARD_SIZE*y + x
+
+symmetries = [[transformCell(cell, s) for cell in range(CELLS)] for s in range(8)]
+inverseSymmetries = []
+for mapping in symmetries:
+    inverse = [0] * CELLS
+    for cell, image in enumerate(mapping):
+        inverse[image] = cell
+    inverseSymmetries.append(inverse)
+
+def canonicalKey(pieces1, pieces2):
+    # Smallest hash over all symmetries of the position,
+    # along with the symmetry that produced it
+    black = list(bits(pieces1))
+    white = list(bits(pieces2))
+    best = None
+    for symmetry, mapping in enumerate(symmetries):
+        key = 0
+        for cell in black:
+            key ^= zobrist[0][mapping[cell]]
+        for cell in white:
+            key ^= zobrist[1][mapping[cell]]
+        if best is None or key < best[0]:
+            best = (key, symmetry)
+    return best
+
+class OpeningBook:
+    # Read-only book, memory-mapped and binary searched so that
+    # opening it costs nothing however large the file is
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            self.close()
+            raise Exception(f"{path} is not an opening book")
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def keyAt(self, index):
+        return struct.unpack_from("<Q", self.data, HEADER.size + index*RECORD.size)[0]
+
+    def entries(self, key):
+        # Binary search for the first record with this key
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.keyAt(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        found = []
+        while low < self.count:
+            recordKey, move, weight = RECORD.unpack_from(
+                self.data, HEADER.size + low*RECORD.size)
+            if recordKey != key:
+                break
+            found.append((move, weight))
+            low += 1
+        return found
+
+    def lookup(self, state):
+        # Returns a book move for the state, chosen at random
+        # weighted by how often it was played, or None
+        occupied = state.pieces1 | state.pieces2
+        if bin(occupied).count("1") >= BOOK_PLIES:
+            return None
+        key, symmetry = canonicalKey(state.pieces1, state.pieces2)
+        entries = self.entries(key)
+        if not entries:
+            return None
+
+        moves = [move for move, _ in entries]
+        weights = [weight for _, weight in entries]
+        move = random.choices(moves, weights)[0]
+        # Map the move back onto the actual board
+        move = inverseSymmetries[symmetry][move]
+        if occupied >> move & 1:
+            return None
+        return move
+
+def loadBook(path=BOOK_PATH):
+    # Book if one has been built, otherwise None
+    if not os.path.exists(path):
+        return None
+    return OpeningBook(path)
+
+def buildBook(games, path, plies=BOOK_PLIES, minCount=2):
+    # Write a book from games given as lists of moves and their
+    # winners, counting the moves played by the winning side
+    counts = {}
+    for moves, winner in games:
+        state = GomokuState()
+        for move in moves[:plies]:
+            if state.currentPlayer == winner:
+                key, symmetry = canonicalKey(state.pieces1, state.pieces2)
+                entry = (key, symmetries[symmetry][move])
+                counts[entry] = counts.get(entry, 0) + 1
+            state.makeMove(move)
+
+    records = sorted(
+        (key, move, count) for (key, move), count in counts.items()
+        if count >= minCount)
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(records)))
+        for record in records:
+            f.write(RECORD.pack(*record))
+    return len(records)
+
+def selfPlayGames(count, iterations):
+    # Play whole games with the engine, returning their moves and
+    # winners. The winner only says something about the opening if
+    # the rest of the game is played as well, so no moves are random
+    for _ in range(count):
+        engine = Engine(processes=1, threads=1)
+        engine.iterations = iterations
+        state = GomokuState()
+        moves = []
+        while not state.isTerminal():
+            move = engine.getMove()
+            state.makeMove(move)
+            moves.append(move)
+        engine.close()
+        yield moves, state.overallWinner
+
+def parseMove(text):
+    # Moves are written as in the move history, e.g. h8
+    x = ord(text[0]) - 97
+    y = int(text[1:]) - 1
+    return BOARD_SIZE*y + x
+
+def recordGames(path):
+    # Game records, one game per line as moves separated by
+    # spaces, and the winner is replayed from the moves
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            state = GomokuState()
+            moves = []
+            for text in line.split():
+                move = parseMove(text)
+                state.makeMove(move)
+                moves.append(move)
+            yield moves, state.overallWinner
+
+def main():
+    parser = argparse.ArgumentParser(description="Build an opening book")
+    parser.add_argument("output", nargs="?", default=BOOK_PATH)
+    parser.add_argument("--records", help="text file of game records")
+    parser.add_argument("--games", type=int, default=100, help="self-play games")
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--plies", type=int, default=BOOK_PLIES)
+    parser.add_argument("--min-count", type=int, default=2)
+    args = parser.parse_args()
+
+    if args.records:
+        games = recordGames(args.records)
+    else:
+        games = selfPlayGames(args.games, args.iterations)
+    count = buildBook(games, args.output, args.plies, args.min_count)
+    print(f"Wrote {count} positions to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+# Local imports
+from gomoku.ai.mcts import GomokuState, MCTSNode, mcts, mctsThreaded, gilEnabled, bestMove, randomBit, TranspositionTable, PONDER_ITERATIONS
+from gomoku.ai.parallel import mctsParallel, ponderParallel, createPool
+from gomoku.ai.solver import ThreatSolver
+from gomoku.ai.arraytree import ArrayTree
+# Module imports
+import os
+import threading
+import time
+
+class Engine:
+    # Search state kept between moves, without any Qt so it can
+    # be used by the GUI workers and from the command line alike
+    def __init__(self, renju=False, processes=None, threads=None, book=None, pool=None):
+        self.node = MCTSNode(GomokuState(renju))
+        # Shared between moves so transpositions found while
+        # searching earlier moves are kept
+        self.table = TranspositionTable()
+
+        # A shared tree is only searched by several threads on
+        # free-threaded builds, otherwise use one tree per process
+        cores = os.cpu_count() or 1
+        if threads is None:
+            threads = 1 if gilEnabled() else cores
+        if processes is None:
+            processes = 1 if threads > 1 else cores
+        self.threads = threads
+        self.processes = processes
+        # Iterations given to each process per move
+        self.iterations = 2000
+        # Process pool, created when first needed unless a
+        # shared one is given, which is then left running
+        self.pool = pool
+        self.ownsPool = pool is None
+
+        # Rollout policy, None for random playouts
+        # (threatRollout plays stronger but slower playouts)
+        self.rollout = None
+        # RAVE equivalence parameter, None to disable (e.g. RAVE_K)
+        self.rave = None
+
+        # Opening book consulted before searching, or None
+        self.book = book
+        # Flat tree searched instead of MCTSNode objects, see useArrayTree
+        self.arrayTree = None
+
+        # Set from another thread to stop pondering
+        self.ponderStop = threading.Event()
+
+    def close(self):
+        if self.pool is not None and self.ownsPool:
+            self.pool.shutdown(cancel_futures=True)
+        self.pool = None
+        if self.book is not None:
+            self.book.close()
+            self.book = None
+
+    def useArrayTree(self, capacity=None):
+        # Search an ArrayTree, which stores nodes in flat arrays rather
+        # than as objects. It only searches in a single thread, without
+        # RAVE, a rollout policy, statistics or analysis
+        if capacity is None:
+            self.arrayTree = ArrayTree(self.node.state)
+        else:
+            self.arrayTree = ArrayTree(self.node.state, capacity)
+
+    def processMove(self, move):
+        if self.arrayTree is not None:
+            self.arrayTree.advance(move)
+        self.node = self.node.getNextNode(move, self.table)
+
+    def getMove(self, deadline=None, stats=None, progress=None, stop=None):
+        # Searches until the deadline, or for the iteration budget
+        # when there is none, and plays the move found.
+        # stats and progress are passed on to the search. Returns
+        # None without playing a move if stop is set during the search
+        move = None
+        state = self.node.state
+        # Early moves come straight from the book when possible
+        if self.book is not None:
+            move = self.book.lookup(state)
+        if move is not None and state.isForbidden(move):
+            move = None
+        if move is None:
+            iterations = self.iterations if deadline is None else None
+            move = self.searchMove(iterations, deadline, stats, progress, stop)
+            if stop is not None and stop.is_set():
+                return None
+        self.processMove(move)
+        return move
+
+    def fallbackMove(self):
+        # Plays a move without searching, for when a search failed or
+        # ran out of time: the most visited move in the tree so far, or
+        # a random legal move. Returns None if there are no legal moves
+        if self.arrayTree is not None and self.arrayTree.children():
+            move = self.arrayTree.bestMove()
+        elif self.node.children:
+            move = bestMove(self.node)
+        elif self.node.state.legalMoves:
+            move = randomBit(self.node.state.legalMoves)
+        else:
+            return None
+        self.processMove(move)
+        return move
+
+    def searchMove(self, iterations, deadline, stats=None, progress=None, stop=None):
+        if self.arrayTree is not None:
+            # The node tree is then only used to follow the position
+            move = self.arrayTree.search(iterations, deadline, stop)
+        elif self.threads > 1:
+            # Tree parallel search on a single shared tree
+            if iterations is not None:
+                iterations *= self.threads
+            move = mctsThreaded(
+                self.node, iterations, self.threads, deadline, self.table,
+                stop, self.rollout, self.rave, stats, progress)
+        elif self.processes > 1:
+            # Root parallel search, each process has the full
+            # iteration count so the wall-clock time is unchanged
+            if self.pool is None:
+                self.pool = createPool(self.processes)
+            if iterations is not None:
+                iterations *= self.processes
+            move = mctsParallel(
+                self.node, iterations, self.pool, self.processes, deadline,
+                self.rollout, self.rave, stats, progress, stop)
+        else:
+            move = mcts(
+                self.node, iterations, deadline, self.table,
+                stop, self.rollout, self.rave, stats, progress)
+        return move
+
+    def ponder(self, stop=None):
+        # Grow the tree from the opponent's position until stopPondering
+        # is called or stop is set, processMove then keeps the matching subtree
+        if self.node.state.isTerminal():
+            return
+        if stop is None:
+            stop = self.ponderStop
+        if self.arrayTree is not None:
+            self.arrayTree.search(PONDER_ITERATIONS, stop=stop)
+        elif self.threads > 1:
+            mctsThreaded(
+                self.node, PONDER_ITERATIONS, self.threads,
+                table=self.table, stop=stop,
+                rollout=self.rollout, rave=self.rave)
+        elif self.processes > 1:
+            # Ponder in every process, as searchMove searches
+            if self.pool is None:
+                self.pool = createPool(self.processes)
+            ponderParallel(
+                self.node, PONDER_ITERATIONS * self.processes, self.pool,
+                self.processes, self.table, stop, self.rollout, self.rave)
+        else:
+            mcts(self.node, PONDER_ITERATIONS, table=self.table,
+                 stop=stop, rollout=self.rollout, rave=self.rave)
+
+    def stopPondering(self):
+        self.ponderStop.set()
+
+class SolverEngine(Engine):
+    # Looks for a forced win with threat-space search first,
+    # then falls back to MCTS when none is found
+    def __init__(self, renju=False, processes=None, threads=None, book=None, pool=None):
+        super(SolverEngine, self).__init__(renju, processes, threads, book, pool)
+        self.solver = ThreatSolver()
+        # Share of the move's time given to the solver
+        self.solverShare = 0.3
+        # Time limit for the solver when the game is untimed
+        self.solverTime = 1
+
+    def searchMove(self, iterations, deadline, stats=None, progress=None, stop=None):
+        start = time.perf_counter()
+        if deadline is None:
+            solverDeadline = start + self.solverTime
+        else:
+            solverDeadline = start + (deadline - start) * self.solverShare
+        move = self.solver.solve(self.node.state, solverDeadline)
+        # The solver does not know the Renju restrictions
+        if move is not None and not self.node.state.isForbidden(move):
+            return move
+        return super(SolverEngine, self).searchMove(iterations, deadline, stats, progress, stop)
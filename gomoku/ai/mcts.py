@@ -1,5 +1,9 @@
+from collections import OrderedDict
+import threading
 import math
 import random
+import sys
+import time
 
 # Get positions based on board size
 BOARD_SIZE = 15
@@ -12,14 +16,272 @@ left2mask = ~(sum(3 << (BOARD_SIZE*y) for y in range(BOARD_SIZE)))
 right2mask = ~(sum(3 << (BOARD_SIZE*y+BOARD_SIZE-2) for y in range(BOARD_SIZE)))
 fullmask = sum(1 << i for i in range(BOARD_SIZE*BOARD_SIZE))
 
+# Shifts for horizontal, vertical, main diagonal and counter diagonal lines
+lineShifts = (1, BOARD_SIZE, BOARD_SIZE+1, BOARD_SIZE-1)
+lineDirections = ((1, 0), (0, 1), (1, 1), (-1, 1))
+# Masks and shifts moving the whole board one step forwards and
+# backwards along each line, negative shifts moving right
+lineSteps = (
+    ((rightmask, 1), (leftmask, -1)),
+    ((fullmask, BOARD_SIZE), (fullmask, -BOARD_SIZE)),
+    ((rightmask, BOARD_SIZE+1), (leftmask, -BOARD_SIZE-1)),
+    ((leftmask, BOARD_SIZE-1), (rightmask, -BOARD_SIZE+1)),
+)
+
+def makeLineMasks(move):
+    # Cells up to 4 away from move along each line
+    masks = []
+    x, y = move % BOARD_SIZE, move // BOARD_SIZE
+    for dx, dy in lineDirections:
+        mask = 0
+        for i in range(-4, 5):
+            cx, cy = x + i*dx, y + i*dy
+            if 0 <= cx < BOARD_SIZE and 0 <= cy < BOARD_SIZE:
+                mask |= 1 << (BOARD_SIZE*cy + cx)
+        masks.append(mask)
+    return tuple(masks)
+
+lineMasks = [makeLineMasks(move) for move in range(BOARD_SIZE*BOARD_SIZE)]
+
+def makeRenjuMasks(move):
+    # For each line, the cells up to 3 away from move, then the windows
+    # that could hold a three or four through move and the cells up to
+    # 4 away. Threes and fours have 2 other pieces within 3 cells, and
+    # only double fours in a line and overlines have 4 within 4 cells
+    nears = []
+    lines = []
+    x, y = move % BOARD_SIZE, move // BOARD_SIZE
+    for direction, far in zip(lineDirections, makeLineMasks(move)):
+        dx, dy = direction
+        cells = {}
+        for i in range(-5, 6):
+            cx, cy = x + i*dx, y + i*dy
+            if i and 0 <= cx < BOARD_SIZE and 0 <= cy < BOARD_SIZE:
+                cells[i] = 1 << (BOARD_SIZE*cy + cx)
+
+        # A three becomes a straight four, 4 pieces with empty cells
+        # either side, and a four has 4 pieces within 5 cells
+        sixes = []
+        for start in range(-4, 0):
+            if all(i in cells for i in range(start, start + 6) if i):
+                inner = sum(cells[i] for i in range(start + 1, start + 5) if i)
+                ends = cells[start] | cells[start + 5]
+                sixes.append((inner | ends, inner, ends))
+        fives = []
+        for start in range(-4, 1):
+            if all(i in cells for i in range(start, start + 5) if i):
+                fives.append(sum(cells[i] for i in range(start, start + 5) if i))
+
+        nears.append(sum(cells[i] for i in range(-3, 4) if i in cells))
+        lines.append((tuple(sixes), tuple(fives), far, direction))
+    return tuple(nears), tuple(lines)
+
+renjuMasks = [makeRenjuMasks(move) for move in range(BOARD_SIZE*BOARD_SIZE)]
+# Cells up to 4 away from each move along any line, every forbidden
+# move has at least 4 other black pieces among them
+renjuStars = [lines[0] | lines[1] | lines[2] | lines[3] for lines in lineMasks]
+
+# Zobrist keys for each player's stone on each cell, seeded so
+# hashes are the same in every process
+_zobristRandom = random.Random(0x60B0)
+zobrist = [
+    [_zobristRandom.getrandbits(64) for _ in range(BOARD_SIZE*BOARD_SIZE)]
+    for _ in range(2)
+]
+
+# Time management
+MOVES_TO_GO = 20
+TIME_MARGIN = 0.2
+MIN_MOVE_TIME = 0.05
+# Iterations between checks for stopping early
+EARLY_STOP_INTERVAL = 64
+
+# Random guesses before falling back to selecting the k-th set bit
+SAMPLE_TRIES = 8
+
+# Upper limit on iterations spent pondering one move
+PONDER_ITERATIONS = 200000
+
+# Seconds between analysis snapshots, and the moves in each
+ANALYSIS_INTERVAL = 0.1
+ANALYSIS_MOVES = 5
+
+# Suggested RAVE equivalence parameter, the number of visits
+# at which a child's own and AMAF statistics weigh equally
+RAVE_K = 500
+
+# Maximum number of positions kept in a transposition table
+TABLE_CAPACITY = 100000
+
+# Visits added to nodes currently being searched by another thread
+VIRTUAL_LOSS = 1
+
+def gilEnabled():
+    # Only free-threaded builds have this function
+    return getattr(sys, "_is_gil_enabled", lambda: True)()
+
+def randomBit(bits):
+    # Rejection sampling between the lowest and highest set bit,
+    # which avoids building a list of every legal move
+    low = (bits & -bits).bit_length() - 1
+    span = bits.bit_length() - low
+    rand = random.random
+    for _ in range(SAMPLE_TRIES):
+        i = low + int(rand() * span)
+        if bits >> i & 1:
+            return i
+
+    # Sparse bitboards, clear the k lowest set bits instead
+    k = random.randrange(bin(bits).count("1"))
+    for _ in range(k):
+        bits &= bits - 1
+    return (bits & -bits).bit_length() - 1
+
+def lineSide(black, empty, x, y, dx, dy):
+    # Walk away from (x, y) along a line through up to three groups of
+    # pieces, returning their sizes and the empty cells between them.
+    # The walk stops at the edge or the opponent's pieces, leaving None
+    groups = [0, 0, 0]
+    gaps = [None, None]
+    group = 0
+    x += dx
+    y += dy
+    while 0 <= x < BOARD_SIZE and 0 <= y < BOARD_SIZE:
+        cell = BOARD_SIZE*y + x
+        if black >> cell & 1:
+            groups[group] += 1
+        elif group < 2 and empty >> cell & 1:
+            gaps[group] = cell
+            group += 1
+        else:
+            break
+        x += dx
+        y += dy
+    return groups, gaps
+
+def lineThreat(black, white, sixes, fives):
+    # Whether a line could hold a three or four, ignoring the rest
+    # of the line, as windows of cells from makeRenjuMasks
+    for cells, inner, ends in sixes:
+        if white & cells or black & ends:
+            continue
+        m = black & inner
+        if m & (m - 1):
+            return True
+    for cells in fives:
+        if white & cells:
+            continue
+        m = black & cells
+        m &= m - 1
+        if m & (m - 1):
+            return True
+    return False
+
+def forbiddenMove(black, white, move):
+    # Renju restrictions on black: overlines, double fours and double
+    # threes. A three only counts if the move making it a straight four
+    # is itself allowed, so false threes are found by recursion. Each
+    # level adds a black piece, so the recursion always ends
+
+    # Rule out most moves before looking at the lines in detail,
+    # keeping only the lines that could hold a three or more
+    m = black & renjuStars[move]
+    m &= m - 1
+    m &= m - 1
+    m &= m - 1
+    if not m:
+        return False
+    nears, lines = renjuMasks[move]
+    candidates = []
+    for near, line in zip(nears, lines):
+        m = black & near
+        if m & (m - 1):
+            candidates.append(line)
+    if not candidates:
+        return False
+
+    directions = []
+    crowded = False
+    for sixes, fives, far, direction in candidates:
+        # A single line can only be forbidden with 4 pieces near
+        if len(candidates) > 1 and not lineThreat(black, white, sixes, fives):
+            continue
+        m = black & far
+        m &= m - 1
+        m &= m - 1
+        m &= m - 1
+        if m:
+            crowded = True
+        elif len(candidates) == 1:
+            return False
+        directions.append(direction)
+    if len(directions) < 2 and not crowded:
+        return False
+
+    black |= 1 << move
+    empty = fullmask & ~(black | white)
+    x, y = move % BOARD_SIZE, move // BOARD_SIZE
+    sides = []
+    for dx, dy in directions:
+        forward = lineSide(black, empty, x, y, dx, dy)
+        backward = lineSide(black, empty, x, y, -dx, -dy)
+        length = 1 + forward[0][0] + backward[0][0]
+        sides.append((length, forward, backward))
+
+    # Exactly five wins even when another line is forbidden
+    if any(length == 5 for length, _, _ in sides):
+        return False
+    if any(length > 5 for length, _, _ in sides):
+        return True
+
+    fours = 0
+    threes = []
+    for length, forward, backward in sides:
+        fives = 0
+        cells = []
+        for (groups, gaps), (otherGroups, otherGaps) in ((forward, backward), (backward, forward)):
+            if gaps[0] is None:
+                continue
+            # Filling the gap joins the next group onto the line
+            joined = length + 1 + groups[1]
+            if joined == 5:
+                fives += 1
+            elif (joined == 4 and gaps[1] is not None and not groups[2]
+                    and otherGaps[0] is not None and not otherGroups[1]):
+                # Makes a straight four, with exactly five at both ends
+                cells.append(gaps[0])
+        if fives:
+            # Both ends of a straight four make five, but it is one four
+            fours += 1 if length == 4 else fives
+        elif cells:
+            threes.append(cells)
+    if fours >= 2:
+        return True
+    if len(threes) < 2:
+        return False
+
+    # Only now look for false threes, as the recursion is expensive
+    count = 0
+    for i, cells in enumerate(threes):
+        if any(not forbiddenMove(black, white, cell) for cell in cells):
+            count += 1
+            if count == 2:
+                return True
+        if count + len(threes) - i - 1 < 2:
+            break
+    return False
+
 class GomokuState:
-    __slots__ = ["pieces1", "pieces2", "currentPlayer", "overallWinner", "legalMoves"]
+    __slots__ = ["pieces1", "pieces2", "currentPlayer", "overallWinner", "legalMoves", "hash", "renju"]
 
-    def __init__(self):
+    def __init__(self, renju=False):
         self.pieces1 = 0
         self.pieces2 = 0
         self.currentPlayer = 1
         self.overallWinner = None
+        self.hash = 0
+        # Black may not play forbidden moves under Renju rules
+        self.renju = renju
         self.calculateLegalMoves()
 
     def clone(self):
@@ -30,9 +292,11 @@ class GomokuState:
         clone.currentPlayer = self.currentPlayer
         clone.overallWinner = self.overallWinner
         clone.legalMoves = self.legalMoves
+        clone.hash = self.hash
+        clone.renju = self.renju
         return clone
 
-    def calculateLegalMoves(self):
+    def calculateLegalMoves(self, exact=True):
         # Get all occupied positions
         occupied = self.pieces1 | self.pieces2
         if not occupied:
@@ -53,6 +317,56 @@ class GomokuState:
         shell &= fullmask & ~occupied
         self.legalMoves = shell
 
+        # Playouts leave forbidden moves in and reject them
+        # in explore instead, as only one move is needed
+        if exact and self.renju and self.currentPlayer == 1:
+            self.legalMoves &= ~self.forbiddenMoves(shell)
+
+    def removeForbidden(self):
+        # Filter legal moves left unfiltered by makeMove(move, False)
+        if self.renju and self.currentPlayer == 1:
+            self.legalMoves &= ~self.forbiddenMoves(self.legalMoves)
+
+    def isForbidden(self, move):
+        # Whether the player to move may not play move
+        if not self.renju or self.currentPlayer != 1:
+            return False
+        return forbiddenMove(self.pieces1, self.pieces2, move)
+
+    def forbiddenMoves(self, candidates):
+        # Forbidden moves for black among candidates. Cells are only
+        # checked if 2 lines have 2 black pieces within 3 cells, or one
+        # line has 3, which is counted for the whole board at once
+        lines = 0
+        pairs = 0
+        crowded = 0
+        for steps in lineSteps:
+            ones = 0
+            twos = 0
+            threes = 0
+            for mask, shift in steps:
+                pieces = self.pieces1
+                for _ in range(3):
+                    if shift > 0:
+                        pieces = (pieces & mask) << shift
+                    else:
+                        pieces = (pieces & mask) >> -shift
+                    threes |= twos & pieces
+                    twos |= ones & pieces
+                    ones |= pieces
+            pairs |= lines & twos
+            lines |= twos
+            crowded |= threes
+        candidates &= pairs | crowded
+
+        forbidden = 0
+        while candidates:
+            bit = candidates & -candidates
+            candidates ^= bit
+            if forbiddenMove(self.pieces1, self.pieces2, bit.bit_length() - 1):
+                forbidden |= bit
+        return forbidden
+
     def checkPiecesWin(self, pieces):
         # Horizontal
         m = pieces & (pieces & rightmask) << 1
@@ -80,6 +394,17 @@ class GomokuState:
 
         return False
 
+    def checkMoveWin(self, pieces, move):
+        # Only the lines through the last move can contain a new five.
+        # Each mask only covers one line, so no edge masks are needed
+        for mask, shift in zip(lineMasks[move], lineShifts):
+            m = pieces & mask
+            m &= m << shift
+            m &= m << (shift*2)
+            if m & m << shift:
+                return True
+        return False
+
     def checkWin(self):
         # Check each set of pieces separately
         if self.checkPiecesWin(self.pieces1):
@@ -88,35 +413,86 @@ class GomokuState:
             return 2
         return 0
 
-    def makeMove(self, move):
+    def makeMove(self, move, exact=True):
         # Flip a single bit
         if self.currentPlayer == 1:
             self.pieces1 |= 1 << move
+            pieces = self.pieces1
         else:
             self.pieces2 |= 1 << move
-        self.calculateLegalMoves()
+            pieces = self.pieces2
+        self.hash ^= zobrist[self.currentPlayer - 1][move]
 
-        # Check win condition for either player
-        win = self.checkWin()
-        if win:
-            self.overallWinner = win
+        # Only the current player can have made a five
+        if self.checkMoveWin(pieces, move):
+            self.overallWinner = self.currentPlayer
 
-        # Flip the current player
+        # Flip the current player, forbidden moves
+        # depend on who is to move next
         self.currentPlayer = 3 - self.currentPlayer
+        self.calculateLegalMoves(exact)
 
     def isTerminal(self):
         return self.overallWinner is not None or self.legalMoves == 0
 
     def explore(self, moves=None):
-        if moves is None:
-            moves = self.legalMoves
-        validMoves = [i for i in range(BOARD_SIZE*BOARD_SIZE) if moves & 1 << i]
-        move = random.choice(validMoves)
-        self.makeMove(move)
+        # Moves given by the tree are already legal, otherwise this
+        # is a playout and legal moves are not filtered exactly. Either
+        # way the legal moves after the move are left unfiltered, the
+        # tree filters them with removeForbidden when it needs them
+        if moves is not None:
+            move = randomBit(moves)
+            self.makeMove(move, False)
+            return move
+
+        moves = self.legalMoves
+        move = randomBit(moves)
+        if self.renju and self.currentPlayer == 1:
+            # Resample until the move is allowed, the count of nearby
+            # pieces from forbiddenMove is checked here first to save
+            # a call for most moves
+            black = self.pieces1
+            while True:
+                m = black & renjuStars[move]
+                m &= m - 1
+                m &= m - 1
+                m &= m - 1
+                if not m or not forbiddenMove(black, self.pieces2, move):
+                    break
+                moves &= ~(1 << move)
+                if not moves:
+                    # Only forbidden moves are left, a draw
+                    self.legalMoves = 0
+                    return None
+                move = randomBit(moves)
+        self.makeMove(move, False)
         return move
 
+class TranspositionTable:
+    # Maps position hashes to nodes so that positions reached by
+    # different move orders share statistics, evicting the least
+    # recently used position once full
+    def __init__(self, capacity=TABLE_CAPACITY):
+        self.capacity = capacity
+        self.nodes = OrderedDict()
+
+    def get(self, key):
+        node = self.nodes.get(key)
+        if node is not None:
+            self.nodes.move_to_end(key)
+        return node
+
+    def add(self, key, node):
+        self.nodes[key] = node
+        self.nodes.move_to_end(key)
+        if len(self.nodes) > self.capacity:
+            self.nodes.popitem(last=False)
+
+    def __len__(self):
+        return len(self.nodes)
+
 class MCTSNode:
-    __slots__ = ["state", "parent", "move", "children", "untriedMoves", "visits", "wins", "lastPlayer"]
+    __slots__ = ["state", "parent", "move", "children", "untriedMoves", "visits", "wins", "lastPlayer", "virtualLoss", "amafVisits", "amafWins"]
 
     def __init__(self, state, parent=None, move=None):
         self.state = state
@@ -127,61 +503,457 @@ class MCTSNode:
         self.visits = 0
         self.wins = 0
         self.lastPlayer = 1 if state.currentPlayer == 2 else 2
+        self.virtualLoss = 0
+        # All-moves-as-first statistics, used by RAVE
+        self.amafVisits = 0
+        self.amafWins = 0
 
-    def uctSelectChild(self, exploration=math.sqrt(2)):
+    def uctSelectChild(self, exploration=math.sqrt(2), raveK=None):
         # Avoid log calculation for each child
-        logN = math.log(self.visits)
-        return max(
-            self.children.values(),
-            key=lambda c: (c.wins / c.visits) + exploration * math.sqrt(logN / c.visits)
-        )
-
-    def addChild(self, move, state):
-        child = MCTSNode(state.clone(), parent=self, move=move)
+        # Virtual loss counts as visits without wins, which steers
+        # other threads away from nodes already being searched
+        logN = math.log(self.visits + self.virtualLoss)
+        if raveK is None:
+            return max(
+                self.children.values(),
+                key=lambda c: (c.wins / (c.visits + c.virtualLoss)) + exploration * math.sqrt(logN / (c.visits + c.virtualLoss))
+            )
+
+        def value(c):
+            # Blend in AMAF statistics, trusting them less as the
+            # child's own visits grow past the equivalence parameter
+            visits = c.visits + c.virtualLoss
+            q = c.wins / visits
+            if c.amafVisits:
+                beta = math.sqrt(raveK / (3*visits + raveK))
+                q = (1 - beta) * q + beta * c.amafWins / c.amafVisits
+            return q + exploration * math.sqrt(logN / visits)
+        return max(self.children.values(), key=value)
+
+    def addChild(self, move, state, table=None):
+        # Another thread may have already expanded this move
+        if move in self.children:
+            return self.children[move]
+
+        # Reuse the node of a transposition if there is one,
+        # in which case parent and move refer to the first path found
+        child = None
+        if table is not None:
+            child = table.get(state.hash)
+        if child is None:
+            child = MCTSNode(state.clone(), parent=self, move=move)
+            if table is not None:
+                table.add(state.hash, child)
         self.untriedMoves &= ~(1 << move)
         self.children[move] = child
         return child
 
+    def removeForbidden(self):
+        # Nodes are added with forbidden moves left in, as most are never
+        # expanded, so they are filtered before the node's first expansion
+        self.state.removeForbidden()
+        self.untriedMoves &= self.state.legalMoves
+
     def update(self, result):
         self.visits += 1
         if result == self.lastPlayer:
             self.wins += 1
 
-    def getNextNode(self, move):
+    def updateMany(self, outcome):
+        # Outcome of several simulations, as (games, wins1, wins2)
+        self.visits += outcome[0]
+        self.wins += outcome[self.lastPlayer]
+
+    def getNextNode(self, move, table=None):
         # Returns the root of a new tree
         # This node cannot be used anymore and should
         # be garbage collected
         if move in self.children:
             node = self.children[move]
             node.parent = None
+            node.removeForbidden()
+            return node
+
+        self.state.makeMove(move)
+        if table is not None:
+            node = table.get(self.state.hash)
+            if node is not None:
+                node.parent = None
+                node.removeForbidden()
+                return node
+        return MCTSNode(self.state)
+
+def updateAmaf(path, state, result):
+    # Credit every child whose move was played later in the
+    # game by the same player, as if it had been played first
+    for node in path:
+        if not node.children:
+            continue
+        if node.state.currentPlayer == 1:
+            played = state.pieces1 & ~node.state.pieces1
         else:
-            self.state.makeMove(move)
-            node = MCTSNode(self.state)
-        return node
+            played = state.pieces2 & ~node.state.pieces2
+        for move, child in node.children.items():
+            if played >> move & 1:
+                child.amafVisits += 1
+                if result == child.lastPlayer:
+                    child.amafWins += 1
+
+def backpropagate(path, state, outcome, rave=None):
+    # Update statistics along the path taken, as nodes may have
+    # several parents. Returns the number of games simulated
+    if outcome is not None:
+        # Batch rollouts return their own results
+        for node in path:
+            node.updateMany(outcome)
+        return outcome[0]
+
+    result = state.overallWinner
+    for node in path:
+        node.update(result)
+    if rave is not None:
+        updateAmaf(path, state, result)
+    return 1
+
+def bestMove(root):
+    # Most visited move, children may be shared so the
+    # dict key is used rather than the child's move
+    return max(root.children.items(), key=lambda item: item[1].visits)[0]
+
+def childCounts(root):
+    # Visits and wins of each move from the root
+    return {move: (c.visits, c.wins) for move, c in root.children.items()}
+
+def replyCounts(root):
+    # Visits and wins of each move from the root,
+    # with the child counts of the replies to it
+    return {move: (c.visits, c.wins, childCounts(c)) for move, c in root.children.items()}
+
+def mergeCounts(countsList):
+    # Add up child counts from several trees of the same root
+    merged = {}
+    for counts in countsList:
+        for move, (v, w) in counts.items():
+            visits, wins = merged.get(move, (0, 0))
+            merged[move] = (visits + v, wins + w)
+    return merged
+
+def topMoves(counts, number=ANALYSIS_MOVES):
+    # Most visited moves as (move, share of visits, win rate),
+    # win rates being for the player to move at the root
+    total = sum(visits for visits, _ in counts.values())
+    moves = sorted(counts, key=lambda move: counts[move], reverse=True)[:number]
+    return [
+        (move, counts[move][0] / total, counts[move][1] / counts[move][0])
+        for move in moves if counts[move][0]
+    ]
+
+class AnalysisThrottle:
+    # Passed to a search as progress, sends child counts to send at
+    # most once per interval. Snapshots in between are dropped
+    # rather than queued, so a slow receiver never holds up the search
+    def __init__(self, send, interval=ANALYSIS_INTERVAL):
+        self.send = send
+        self.interval = interval
+        self.next = 0
+
+    def ready(self):
+        now = time.perf_counter()
+        if now < self.next:
+            return False
+        self.next = now + self.interval
+        return True
+
+    def poll(self, root):
+        # Cheap enough to call every iteration
+        if self.ready():
+            self.send(childCounts(root))
+
+def allocateTime(remaining, increment):
+    # Spend a fraction of the remaining clock plus most of the
+    # increment, keeping a margin so the flag never falls
+    budget = remaining / MOVES_TO_GO + increment * 0.8
+    budget = min(budget, remaining / 2 - TIME_MARGIN)
+    return max(budget, MIN_MOVE_TIME)
+
+def canStopEarly(root, remaining):
+    # Stop once the most visited child cannot be overtaken
+    # by the iterations that are left
+    if not root.children:
+        return False
+    if root.untriedMoves:
+        # Untried moves have no visits yet
+        second = 0
+    elif len(root.children) == 1:
+        # Only one move is possible
+        return True
+    else:
+        second = sorted((c.visits for c in root.children.values()))[-2]
+    best = max(c.visits for c in root.children.values())
+    return best - second > remaining
+
+def searchFinished(root, count, iterations, deadline, start, stop=None, scale=1):
+    # Called between iterations, returns True when the search should stop
+    if stop is not None and stop.is_set():
+        return True
+    if iterations is not None and count >= iterations:
+        return True
+    if deadline is not None and time.perf_counter() >= deadline:
+        return True
+    if count % EARLY_STOP_INTERVAL:
+        return False
+
+    # Estimate how many iterations are left from both budgets
+    remaining = math.inf
+    if iterations is not None:
+        remaining = iterations - count
+    if deadline is not None:
+        now = time.perf_counter()
+        rate = count / max(now - start, 1e-9)
+        remaining = min(remaining, rate * (deadline - now))
+    # Convert to visits when each iteration simulates several games
+    return canStopEarly(root, remaining * scale)
+
+class SearchStats:
+    # Optional instrumentation, filled in by a search when passed as
+    # stats. Phase times are only recorded by single-threaded searches
+    PHASES = ("selection", "expansion", "simulation", "backpropagation")
+
+    def __init__(self):
+        self.times = dict.fromkeys(SearchStats.PHASES, 0)
+        self.totalTime = 0
+        self.iterations = 0
+        self.games = 0
+        self.rolloutMoves = 0
+        self.rollouts = 0
+        self.maxDepth = 0
+        self.nodes = 0
+        self.principalVariation = []
+        self.startTime = None
+        self.mark = None
+
+    def start(self):
+        self.startTime = self.mark = time.perf_counter()
+
+    def lap(self, phase):
+        # Time since the end of the previous phase
+        now = time.perf_counter()
+        self.times[phase] += now - self.mark
+        self.mark = now
 
-def mcts(root, iterations):
-    for i in range(iterations):
+    def startRollout(self, state, depth):
+        # Returns the stone count to pass to endRollout
+        self.maxDepth = max(self.maxDepth, depth)
+        return bin(state.pieces1 | state.pieces2).count("1")
+
+    def endRollout(self, state, stones):
+        # Rollouts that simulate elsewhere leave the state unchanged
+        moves = bin(state.pieces1 | state.pieces2).count("1") - stones
+        if moves:
+            self.rolloutMoves += moves
+            self.rollouts += 1
+
+    def finish(self, root, iterations, games):
+        self.totalTime += time.perf_counter() - self.startTime
+        self.iterations += iterations
+        self.games += games
+
+        # Count nodes once each, as transpositions have several parents
+        seen = {id(root)}
+        stack = [root]
+        while stack:
+            for child in stack.pop().children.values():
+                if id(child) not in seen:
+                    seen.add(id(child))
+                    stack.append(child)
+        self.nodes = len(seen)
+
+        # Follow the most visited children
+        self.principalVariation = []
         node = root
-        state = node.state.clone()
+        while node.children and len(self.principalVariation) < BOARD_SIZE*BOARD_SIZE:
+            move = bestMove(node)
+            self.principalVariation.append(move)
+            node = node.children[move]
+
+    def merge(self, other):
+        # Add the counts from a search of another tree
+        for phase in SearchStats.PHASES:
+            self.times[phase] += other.times[phase]
+        self.iterations += other.iterations
+        self.games += other.games
+        self.rolloutMoves += other.rolloutMoves
+        self.rollouts += other.rollouts
+        self.maxDepth = max(self.maxDepth, other.maxDepth)
+        self.nodes += other.nodes
+
+    def iterationsPerSecond(self):
+        return self.iterations / self.totalTime if self.totalTime else 0
+
+    def averageRolloutLength(self):
+        return self.rolloutMoves / self.rollouts if self.rollouts else 0
+
+    def summary(self):
+        # Lines of text for display
+        lines = [
+            f"{self.iterations} iterations, {self.iterationsPerSecond():.0f}/s",
+            f"{self.nodes} nodes, depth {self.maxDepth}",
+            f"Rollout length {self.averageRolloutLength():.1f}",
+        ]
+        phaseTime = sum(self.times.values())
+        if phaseTime:
+            lines.append(" ".join(
+                f"{phase[:6].capitalize()} {100 * t / phaseTime:.0f}%"
+                for phase, t in self.times.items()))
+        if self.principalVariation:
+            lines.append("PV " + " ".join(
+                chr(move % BOARD_SIZE + 97) + str(move // BOARD_SIZE + 1)
+                for move in self.principalVariation[:10]))
+        return "\n".join(lines)
+
+def mcts(root, iterations=None, deadline=None, table=None, stop=None, rollout=None, rave=None, stats=None, progress=None):
+    # Search until the iteration budget or the deadline
+    # (compared against time.perf_counter) runs out,
+    # or until the stop event is set from another thread.
+    # rollout plays a state to the end, random moves if None,
+    # or may return (games, wins1, wins2) when simulating several games.
+    # rave is the RAVE equivalence parameter, None to disable.
+    # stats is a SearchStats to record where the time went, or None.
+    # progress is an AnalysisThrottle to stream the root's children to
+    if iterations is None and deadline is None:
+        raise Exception("mcts requires an iteration count or deadline")
+
+    start = time.perf_counter()
+    count = 0
+    games = 0
+    if stats is not None:
+        stats.start()
+    while True:
+        node = root
+        path = [node]
 
         # Selection
         while not node.untriedMoves and node.children:
-            node = node.uctSelectChild()
-            state.makeMove(node.move)
+            node = node.uctSelectChild(raveK=rave)
+            path.append(node)
+        if not node.children:
+            node.removeForbidden()
+        state = node.state.clone()
+        if stats is not None:
+            stats.lap("selection")
 
         # Expansion
         if node.untriedMoves:
             move = state.explore(node.untriedMoves)
-            node = node.addChild(move, state)
+            node = node.addChild(move, state, table)
+            path.append(node)
+        if stats is not None:
+            stats.lap("expansion")
+            stones = stats.startRollout(state, len(path) - 1)
 
         # Simulation
-        while not state.isTerminal():
-            state.explore()
+        outcome = None
+        if rollout is None:
+            while not state.isTerminal():
+                state.explore()
+        else:
+            outcome = rollout(state)
+        if stats is not None:
+            stats.lap("simulation")
+            stats.endRollout(state, stones)
 
         # Backpropagation
-        result = state.overallWinner
-        while node is not None:
-            node.update(result)
-            node = node.parent
+        games += backpropagate(path, state, outcome, rave)
+        if stats is not None:
+            stats.lap("backpropagation")
+        if progress is not None:
+            progress.poll(root)
+
+        count += 1
+        if searchFinished(root, count, iterations, deadline, start, stop, games / count):
+            break
+
+    if stats is not None:
+        stats.finish(root, count, games)
+    return bestMove(root)
+
+def mctsThreaded(root, iterations, threads, deadline=None, table=None, stop=None, rollout=None, rave=None, stats=None, progress=None):
+    # Shared trees only run faster when threads are not limited by the GIL
+    if threads <= 1 or gilEnabled():
+        return mcts(root, iterations, deadline, table, stop, rollout, rave, stats, progress)
+    if iterations is None and deadline is None:
+        raise Exception("mcts requires an iteration count or deadline")
+
+    # A single lock protects the tree, only the simulation runs concurrently
+    lock = threading.Lock()
+    start = time.perf_counter()
+    started = [0]
+    finished = [False]
+    # Completed iterations and the games they simulated
+    completed = [0]
+    games = [0]
+    # Phases overlap between threads, so only totals are recorded
+    if stats is not None:
+        stats.start()
+
+    def search():
+        while True:
+            with lock:
+                if finished[0]:
+                    return
+                started[0] += 1
+
+                node = root
+                path = [node]
+                node.virtualLoss += VIRTUAL_LOSS
+
+                # Selection
+                while not node.untriedMoves and node.children:
+                    node = node.uctSelectChild(raveK=rave)
+                    node.virtualLoss += VIRTUAL_LOSS
+                    path.append(node)
+                if not node.children:
+                    node.removeForbidden()
+                state = node.state.clone()
+
+                # Expansion
+                if node.untriedMoves:
+                    move = state.explore(node.untriedMoves)
+                    node = node.addChild(move, state, table)
+                    node.virtualLoss += VIRTUAL_LOSS
+                    path.append(node)
+                if stats is not None:
+                    stones = stats.startRollout(state, len(path) - 1)
+
+                scale = games[0] / max(completed[0], 1) or 1
+                if searchFinished(root, started[0], iterations, deadline, start, stop, scale):
+                    finished[0] = True
+
+            # Simulation
+            outcome = None
+            if rollout is None:
+                while not state.isTerminal():
+                    state.explore()
+            else:
+                outcome = rollout(state)
+
+            # Backpropagation, removing virtual loss on the way
+            with lock:
+                games[0] += backpropagate(path, state, outcome, rave)
+                completed[0] += 1
+                for node in path:
+                    node.virtualLoss -= VIRTUAL_LOSS
+                if stats is not None:
+                    stats.endRollout(state, stones)
+                if progress is not None:
+                    progress.poll(root)
+
+    pool = [threading.Thread(target=search) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
 
-    return max(root.children.values(), key=lambda c: c.visits).move
+    if stats is not None:
+        stats.finish(root, completed[0], games[0])
+    return bestMove(root)
@@ -0,0 +1,185 @@
+# Local imports
+from gomoku.ai.mcts import MCTSNode, TranspositionTable, SearchStats, AnalysisThrottle, mcts, childCounts, replyCounts, mergeCounts, ANALYSIS_INTERVAL
+# Module imports
+from concurrent.futures import ProcessPoolExecutor, wait
+from queue import Empty
+import itertools
+import multiprocessing
+import random
+import time
+
+# Seconds between checks for pondering in other processes being stopped
+PONDER_INTERVAL = 0.01
+
+# Identifies each parallel search, so snapshots left in the
+# queue from an earlier search can be told apart
+_searchIds = itertools.count()
+# Queue that pool processes send analysis snapshots through
+_analysisQueue = None
+# Flags shared with pool processes to cancel a search, each
+# search using the slot given by its id
+_cancelFlags = None
+CANCEL_SLOTS = 64
+
+def _initWorker(queue, flags):
+    global _analysisQueue, _cancelFlags
+    _analysisQueue = queue
+    _cancelFlags = flags
+
+class _CancelFlag:
+    # Stands in for a threading.Event as the stop of a search
+    def __init__(self, slot):
+        self.slot = slot
+
+    def is_set(self):
+        return _cancelFlags[self.slot] != 0
+
+def _searchWorker(state, iterations, wallDeadline, rollout, rave, stats, analysis, slot, replies=False):
+    # Forked processes inherit the same random state,
+    # so reseed to make each tree different
+    random.seed()
+    root = MCTSNode(state)
+    table = TranspositionTable()
+    # Only time.time is shared between processes, so the deadline is
+    # passed as a wall-clock time, counting the time spent starting
+    # the process and waiting in the queue against the search
+    deadline = None
+    if wallDeadline is not None:
+        deadline = time.perf_counter() + wallDeadline - time.time()
+    stats = SearchStats() if stats else None
+    # analysis is the search and process number to tag snapshots with
+    progress = None
+    if analysis is not None:
+        progress = AnalysisThrottle(lambda counts: _analysisQueue.put((*analysis, counts)))
+    mcts(root, iterations, deadline, table, stop=_CancelFlag(slot),
+         rollout=rollout, rave=rave, stats=stats, progress=progress)
+    # Pondering needs the replies to each move as well
+    if replies:
+        return replyCounts(root), stats
+    return childCounts(root), stats
+
+def createPool(processes):
+    # Pool is kept alive between moves to avoid the
+    # cost of starting new processes every search.
+    # Spawn is used as forking a process running Qt threads is unsafe
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    flags = context.Array("b", CANCEL_SLOTS, lock=False)
+    pool = ProcessPoolExecutor(
+        max_workers=processes, mp_context=context,
+        initializer=_initWorker, initargs=(queue, flags))
+    # Kept with the pool, as only its processes can use them
+    pool.analysisQueue = queue
+    pool.cancelFlags = flags
+    return pool
+
+def mctsParallel(root, iterations, pool, processes, deadline=None, rollout=None, rave=None, stats=None, progress=None, stop=None):
+    if iterations is None and deadline is None:
+        raise Exception("mcts requires an iteration count or deadline")
+    if stats is not None:
+        stats.start()
+
+    wallDeadline = None
+    if deadline is not None:
+        wallDeadline = time.time() + deadline - time.perf_counter()
+
+    # Split iterations evenly between processes, each
+    # growing a separate tree from the same root state
+    searchId = next(_searchIds)
+    slot = searchId % CANCEL_SLOTS
+    pool.cancelFlags[slot] = 0
+    futures = []
+    for i in range(processes):
+        count = None
+        if iterations is not None:
+            share, extra = divmod(iterations, processes)
+            count = share + (1 if i < extra else 0)
+            if not count:
+                continue
+        analysis = (searchId, i) if progress is not None else None
+        futures.append(pool.submit(
+            _searchWorker, root.state, count, wallDeadline, rollout, rave,
+            stats is not None, analysis, slot))
+
+    # The root's own tree may have been grown while pondering
+    own = childCounts(root)
+    latest = {}
+    pending = futures
+    # Wake up regularly to pass on cancellation and the deadline,
+    # and to merge the latest snapshot from each process
+    while pending and (progress is not None or stop is not None or deadline is not None):
+        _, pending = wait(pending, timeout=ANALYSIS_INTERVAL)
+        if stop is not None and stop.is_set():
+            pool.cancelFlags[slot] = 1
+        if deadline is not None and time.perf_counter() >= deadline:
+            pool.cancelFlags[slot] = 1
+        if progress is not None:
+            while True:
+                try:
+                    search, index, counts = pool.analysisQueue.get_nowait()
+                except Empty:
+                    break
+                if search == searchId:
+                    latest[index] = counts
+            if pending and latest and progress.ready():
+                progress.send(mergeCounts([own, *latest.values()]))
+
+    # Merge child statistics from every tree
+    results = []
+    variations = []
+    for future in futures:
+        children, workerStats = future.result()
+        results.append(children)
+        if workerStats is not None:
+            stats.merge(workerStats)
+            variations.append(workerStats.principalVariation)
+
+    counts = mergeCounts([own, *results])
+    move = max(counts, key=lambda move: counts[move])
+    if stats is not None:
+        # Processes ran at the same time, so use the elapsed time,
+        # and the longest variation from a tree that agrees on the move
+        stats.totalTime += time.perf_counter() - stats.startTime
+        stats.principalVariation = max(
+            (pv for pv in variations if pv and pv[0] == move), key=len, default=[move])
+    return move
+
+def ponderParallel(root, iterations, pool, processes, table=None, stop=None, rollout=None, rave=None):
+    # Ponder from the opponent's position with a tree in each process,
+    # until stop is set or the iterations are used. The replies found
+    # to each of the opponent's moves are added to the root's tree, so
+    # after the opponent moves the new root starts with them and
+    # mctsParallel merges them with its own processes' counts
+    searchId = next(_searchIds)
+    slot = searchId % CANCEL_SLOTS
+    pool.cancelFlags[slot] = 0
+    futures = []
+    for i in range(processes):
+        share, extra = divmod(iterations, processes)
+        count = share + (1 if i < extra else 0)
+        if count:
+            futures.append(pool.submit(
+                _searchWorker, root.state, count, None, rollout, rave,
+                False, None, slot, True))
+
+    pending = futures
+    while pending:
+        _, pending = wait(pending, timeout=PONDER_INTERVAL)
+        if stop is not None and stop.is_set():
+            pool.cancelFlags[slot] = 1
+
+    for future in futures:
+        counts = future.result()[0]
+        for move, (visits, wins, replies) in counts.items():
+            state = root.state.clone()
+            state.makeMove(move, False)
+            child = root.addChild(move, state, table)
+            for reply, (replyVisits, replyWins) in replies.items():
+                replyState = state.clone()
+                replyState.makeMove(reply, False)
+                node = child.addChild(reply, replyState, table)
+                node.visits += replyVisits
+                node.wins += replyWins
+            child.visits += visits
+            child.wins += wins
+            root.visits += visits
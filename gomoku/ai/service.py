@@ -0,0 +1,168 @@
+# Local imports
+from gomoku.ai.parallel import createPool
+# Module imports
+from collections import deque
+import os
+import threading
+import time
+
+# Threads searching at once, each search may use the whole process pool
+SEARCH_WORKERS = 2
+
+class ServiceTask:
+    # Work for one engine, run by the service after that engine's
+    # earlier tasks. function is called with the task and its result
+    # stored, then callback is called with the task on the service's
+    # thread. stop is set when the task is cancelled, which searches
+    # passed it as their stop check finish early on
+    def __init__(self, function, callback=None, timeout=None, ponder=False):
+        self.function = function
+        self.callback = callback
+        # Latest time the task may finish, as time.perf_counter
+        self.deadline = None
+        if timeout is not None:
+            self.deadline = time.perf_counter() + timeout
+        # Pondering is stopped when other work is submitted
+        self.ponder = ponder
+        self.stop = threading.Event()
+        # Set along with stop when the deadline passes while running
+        self.expired = False
+        self.result = None
+        # "cancelled", "timeout" or the exception raised, None on success
+        self.error = None
+        self.done = threading.Event()
+
+    def cancel(self):
+        self.stop.set()
+
+    def expire(self):
+        self.expired = True
+        self.stop.set()
+
+    def capDeadline(self, deadline):
+        # Earlier of a search deadline and the task's own
+        if self.deadline is None:
+            return deadline
+        if deadline is None:
+            return self.deadline
+        return min(deadline, self.deadline)
+
+class EngineService:
+    # Runs tasks for any number of engines on a fixed number of threads.
+    # Each engine's tasks run one at a time in the order submitted,
+    # so an engine's tree is never used by two threads at once
+    def __init__(self, workers=SEARCH_WORKERS, processes=None):
+        # Process pool shared by every engine searching in parallel
+        self.processes = processes or os.cpu_count() or 1
+        self.pool = createPool(self.processes) if self.processes > 1 else None
+
+        self.lock = threading.Condition()
+        # Tasks waiting for each engine, and engines ready to run
+        self.tasks = {}
+        self.ready = deque()
+        # Task being run for each busy engine
+        self.running = {}
+        self.closed = False
+        self.threads = [threading.Thread(target=self.work) for _ in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, engine, task):
+        with self.lock:
+            if self.closed:
+                raise Exception("Engine service has been shut down")
+            # Pondering gives way to the engine's own tasks, and to
+            # any other work when every thread is busy. Pondering with
+            # the shared pool would hold up other engines' searches
+            # until it ended, so then it gives way to any work
+            if self.pool is None and len(self.running) < len(self.threads):
+                self.cancelPondering(engine)
+            else:
+                self.cancelPondering()
+            queue = self.tasks.setdefault(engine, deque())
+            queue.append(task)
+            if engine not in self.running and len(queue) == 1:
+                self.ready.append(engine)
+                self.lock.notify()
+        return task
+
+    def cancelPondering(self, engine=None):
+        # Pondering tasks of one engine, or of every engine if None
+        with self.lock:
+            tasks = list(self.running.items())
+            tasks += [(e, t) for e, queue in self.tasks.items() for t in queue]
+            for owner, task in tasks:
+                if task.ponder and (engine is None or owner is engine):
+                    task.cancel()
+
+    def cancel(self, engine):
+        # Cancel every task submitted for an engine so far
+        with self.lock:
+            for task in self.tasks.get(engine, ()):
+                task.cancel()
+            if engine in self.running:
+                self.running[engine].cancel()
+
+    def work(self):
+        while True:
+            with self.lock:
+                while not self.ready and not self.closed:
+                    self.lock.wait()
+                if not self.ready:
+                    return
+                engine = self.ready.popleft()
+                task = self.tasks[engine].popleft()
+                self.running[engine] = task
+
+            self.run(task)
+
+            with self.lock:
+                del self.running[engine]
+                if self.tasks[engine]:
+                    self.ready.append(engine)
+                    self.lock.notify()
+                else:
+                    del self.tasks[engine]
+
+    def run(self, task):
+        # Tasks cancelled or timed out while waiting are not started
+        if task.stop.is_set():
+            task.error = "cancelled"
+        elif task.deadline is not None and time.perf_counter() >= task.deadline:
+            task.error = "timeout"
+        else:
+            # Stop the task when its deadline passes, whether or
+            # not its function checks the deadline itself
+            timer = None
+            if task.deadline is not None:
+                timer = threading.Timer(task.deadline - time.perf_counter(), task.expire)
+                timer.start()
+            try:
+                task.result = task.function(task)
+                if task.stop.is_set():
+                    task.error = "timeout" if task.expired else "cancelled"
+            except Exception as error:
+                task.error = error
+            if timer is not None:
+                timer.cancel()
+        task.done.set()
+        if task.callback is not None:
+            task.callback(task)
+
+    def shutdown(self):
+        # Cancel everything and wait for the threads to finish, running
+        # searches stop at their next check of the stop event
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            for queue in self.tasks.values():
+                for task in queue:
+                    task.cancel()
+            for task in self.running.values():
+                task.cancel()
+            self.lock.notify_all()
+        for thread in self.threads:
+            thread.join()
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
@@ -0,0 +1,156 @@
+# Local imports
+from gomoku.ai.mcts import BOARD_SIZE, fullmask
+from gomoku.ai.threats import fiveWindows, sixWindows, fiveCells, localOpenFourCells, fourMoves, threeMoves, bits
+# Module imports
+import time
+
+# Default limits for a single solve
+NODE_LIMIT = 20000
+VCF_DEPTH = 12
+VCT_DEPTH = 4
+
+# Cells on the lines through each cell that can take part in a threat
+threatArea = []
+for move in range(BOARD_SIZE*BOARD_SIZE):
+    area = 0
+    for window in fiveWindows[move]:
+        area |= window
+    for middle, ends in sixWindows[move]:
+        area |= middle | ends
+    threatArea.append(area)
+
+class SolverLimit(Exception):
+    # Raised when the node or time limit runs out
+    pass
+
+def countBits(cells):
+    return bin(cells).count("1")
+
+def splitPieces(state):
+    # Pieces of the player to move, then their opponent
+    if state.currentPlayer == 1:
+        return state.pieces1, state.pieces2
+    return state.pieces2, state.pieces1
+
+class ThreatSolver:
+    # Threat-space search for a forced win by the player to move.
+    # Victory by continuous fours (VCF) only plays fours, which the
+    # opponent must block. Victory by continuous threats (VCT) also
+    # plays threes, and every reply that stops the three is tried
+    def __init__(self, nodeLimit=NODE_LIMIT, vcfDepth=VCF_DEPTH, vctDepth=VCT_DEPTH):
+        self.nodeLimit = nodeLimit
+        self.vcfDepth = vcfDepth
+        self.vctDepth = vctDepth
+        self.nodes = 0
+        self.deadline = None
+        self.table = {}
+
+    def solve(self, state, deadline=None):
+        # Returns the first move of a forced win, or None if no
+        # win was found within the limits
+        self.nodes = 0
+        self.deadline = deadline
+        # Positions differ between solves, so start a new table
+        self.table = {}
+        try:
+            # Iterative deepening, trying the cheaper VCF first
+            for threes, maxDepth in ((False, self.vcfDepth), (True, self.vctDepth)):
+                for depth in range(1, maxDepth + 1):
+                    move = self.attack(state, depth, threes)
+                    if move is not None:
+                        return move
+        except SolverLimit:
+            pass
+        return None
+
+    def countNode(self):
+        self.nodes += 1
+        if self.nodes > self.nodeLimit:
+            raise SolverLimit()
+        if self.deadline is not None and self.nodes % 64 == 0:
+            if time.perf_counter() >= self.deadline:
+                raise SolverLimit()
+
+    def orderMoves(self, moves, own):
+        # Try moves with the most of our pieces around them first
+        return sorted(bits(moves), key=lambda m: countBits(own & threatArea[m]), reverse=True)
+
+    def attack(self, state, depth, threes):
+        # Attacker to move, returns a winning move or None
+        self.countNode()
+        own, opponent = splitPieces(state)
+        empty = fullmask & ~(own | opponent)
+        legal = state.legalMoves
+
+        # Immediate win
+        cells = fiveCells(own, legal)
+        if cells:
+            return (cells & -cells).bit_length() - 1
+        if depth == 0:
+            return None
+
+        # Results are stored with the depth they were searched to
+        key = (state.hash, threes)
+        if key in self.table:
+            searched, move = self.table[key]
+            if move is not None or searched >= depth:
+                return move
+
+        # The opponent's four must be blocked, and two cannot be
+        blocks = fiveCells(opponent, legal)
+        if countBits(blocks) > 1:
+            self.table[key] = (depth, None)
+            return None
+
+        candidates = blocks if blocks else legal
+        fours = fourMoves(own, candidates, empty)
+        moves = self.orderMoves(fours, own)
+        if threes:
+            moves += self.orderMoves(threeMoves(own, candidates & ~fours, empty), own)
+
+        result = None
+        for move in moves:
+            child = state.clone()
+            child.makeMove(move)
+            if self.defend(child, depth - 1, threes, move):
+                result = move
+                break
+        self.table[key] = (depth, result)
+        return result
+
+    def defend(self, state, depth, threes, last):
+        # Defender to move after the attacker played last,
+        # returns True if the attacker still wins
+        self.countNode()
+        own, attacker = splitPieces(state)
+        empty = fullmask & ~(own | attacker)
+        legal = state.legalMoves
+
+        # Defender completes a five first
+        if fiveCells(own, legal):
+            return False
+
+        # A four must be blocked, two fours cannot be
+        fives = fiveCells(attacker, legal)
+        if countBits(fives) > 1:
+            return True
+        if fives:
+            replies = fives
+        else:
+            # Replies to a three are the moves that stop it becoming
+            # a straight four, and any four of the defender's own
+            replies = 0
+            for move in bits(threatArea[last] & empty):
+                bit = 1 << move
+                if not localOpenFourCells(attacker, empty & ~bit, last):
+                    replies |= bit
+            replies |= fourMoves(own, legal, empty)
+            if not replies:
+                return True
+
+        for move in bits(replies):
+            child = state.clone()
+            child.makeMove(move)
+            if self.attack(child, depth, threes) is None:
+                return False
+        return True
@@ -0,0 +1,194 @@
+# Local imports
+from gomoku.ai.mcts import BOARD_SIZE, fullmask, lineShifts, lineDirections, randomBit
+
+def makeShiftMask(direction, steps):
+    # Cells that stay on the board when moved steps along direction
+    dx, dy = lineDirections[direction]
+    mask = 0
+    for y in range(BOARD_SIZE):
+        for x in range(BOARD_SIZE):
+            if 0 <= x + steps*dx < BOARD_SIZE and 0 <= y + steps*dy < BOARD_SIZE:
+                mask |= 1 << (BOARD_SIZE*y + x)
+    return mask
+
+# Masks for each direction and each step from -5 to 5
+shiftMasks = [
+    {steps: makeShiftMask(direction, steps) for steps in range(-5, 6)}
+    for direction in range(4)
+]
+
+def shift(pieces, direction, steps):
+    # Move every piece steps cells along direction, dropping
+    # pieces that would leave the board instead of wrapping
+    pieces &= shiftMasks[direction][steps]
+    offset = steps * lineShifts[direction]
+    if offset >= 0:
+        return pieces << offset
+    return pieces >> -offset
+
+def fiveCells(pieces, empty):
+    # Empty cells that complete five in a row for pieces,
+    # trying the cell in each of the 5 positions of a window
+    cells = 0
+    for direction in range(4):
+        # shifted[k] holds cells whose neighbour k steps away is a piece
+        shifted = {k: shift(pieces, direction, -k) for k in range(-4, 5) if k}
+        for gap in range(5):
+            m = empty
+            for k in range(-gap, 5 - gap):
+                if k:
+                    m &= shifted[k]
+                    if not m:
+                        break
+            cells |= m
+    return cells
+
+def openFourCells(pieces, candidates, empty):
+    # Candidate cells that make a straight four (_XXXX_) for pieces,
+    # which is how an open three becomes unstoppable
+    cells = 0
+    for direction in range(4):
+        shiftedPieces = {}
+        shiftedEmpty = {}
+        for gap in range(1, 5):
+            m = candidates
+            for i in range(6):
+                k = i - gap
+                if i == 0 or i == 5:
+                    # Both ends of the window are empty
+                    if k not in shiftedEmpty:
+                        shiftedEmpty[k] = shift(empty, direction, -k)
+                    m &= shiftedEmpty[k]
+                elif k:
+                    if k not in shiftedPieces:
+                        shiftedPieces[k] = shift(pieces, direction, -k)
+                    m &= shiftedPieces[k]
+                if not m:
+                    break
+            cells |= m
+    return cells
+
+def makeWindows(move, length):
+    # Masks of every line of length cells passing through move, along
+    # with the position of move within the line
+    windows = []
+    x, y = move % BOARD_SIZE, move // BOARD_SIZE
+    for dx, dy in lineDirections:
+        for start in range(-length + 1, 1):
+            cells = []
+            for i in range(start, start + length):
+                cx, cy = x + i*dx, y + i*dy
+                if 0 <= cx < BOARD_SIZE and 0 <= cy < BOARD_SIZE:
+                    cells.append(1 << (BOARD_SIZE*cy + cx))
+            if len(cells) == length:
+                windows.append((cells, -start))
+    return windows
+
+# Lines of five through each cell
+fiveWindows = [
+    [sum(cells) for cells, _ in makeWindows(move, 5)]
+    for move in range(BOARD_SIZE*BOARD_SIZE)
+]
+# Lines of six through each cell, split into the middle four
+# and the two ends, only where the cell is in the middle
+sixWindows = [
+    [(sum(cells[1:5]), cells[0] | cells[5])
+     for cells, index in makeWindows(move, 6) if 0 < index < 5]
+    for move in range(BOARD_SIZE*BOARD_SIZE)
+]
+
+def localFiveCells(pieces, empty, move):
+    # Same as fiveCells, but only for lines through move
+    cells = 0
+    for window in fiveWindows[move]:
+        # One cell left, and it must be empty
+        m = window & ~pieces
+        if not m & (m - 1) and m & empty:
+            cells |= m
+    return cells
+
+def localOpenFourCells(pieces, empty, move):
+    # Same as openFourCells, but only for lines through move
+    cells = 0
+    for middle, ends in sixWindows[move]:
+        if ends & empty != ends:
+            continue
+        m = middle & ~pieces
+        if not m & (m - 1) and m & empty:
+            cells |= m
+    return cells
+
+def threatMove(state, ownLast=None, opponentLast=None):
+    # Returns a forcing move for the current player, or None
+    # if there is nothing urgent to play. When the last move of
+    # a player is known only lines through it are checked, as the
+    # policy would already have answered any older threats
+    if state.currentPlayer == 1:
+        own, opponent = state.pieces1, state.pieces2
+    else:
+        own, opponent = state.pieces2, state.pieces1
+    legal = state.legalMoves
+    empty = fullmask & ~(own | opponent)
+
+    # Play a winning five
+    if ownLast is None:
+        cells = fiveCells(own, legal)
+    else:
+        cells = localFiveCells(own, empty, ownLast)
+    if cells:
+        return randomBit(cells)
+
+    # Block the opponent's four
+    if opponentLast is None:
+        cells = fiveCells(opponent, legal)
+    else:
+        cells = localFiveCells(opponent, empty, opponentLast)
+    if cells:
+        return randomBit(cells)
+
+    # Stop an open three from becoming a straight four
+    if opponentLast is None:
+        cells = openFourCells(opponent, legal, empty)
+    else:
+        cells = localOpenFourCells(opponent, empty, opponentLast)
+    if cells:
+        return randomBit(cells)
+    return None
+
+def threatRollout(state):
+    # Play out the game, making wins, blocking fours and answering
+    # open threes before falling back to a random move
+    lastMoves = {1: None, 2: None}
+    while not state.isTerminal():
+        player = state.currentPlayer
+        move = threatMove(state, lastMoves[player], lastMoves[3 - player])
+        if move is None or state.isForbidden(move):
+            move = state.explore()
+        else:
+            state.makeMove(move, False)
+        lastMoves[player] = move
+
+def bits(cells):
+    # Iterate over the indices of set bits
+    while cells:
+        low = cells & -cells
+        yield low.bit_length() - 1
+        cells ^= low
+
+def fourMoves(pieces, candidates, empty):
+    # Candidate cells that leave pieces one move from five
+    moves = 0
+    for move in bits(candidates):
+        bit = 1 << move
+        if localFiveCells(pieces | bit, empty & ~bit, move):
+            moves |= bit
+    return moves
+
+def threeMoves(pieces, candidates, empty):
+    # Candidate cells that leave pieces one move from a straight four
+    moves = 0
+    for move in bits(candidates):
+        bit = 1 << move
+        if localOpenFourCells(pieces | bit, empty & ~bit, move):
+            moves |= bit
+    return moves
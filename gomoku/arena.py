@@ -0,0 +1,280 @@
+# Local imports
+from gomoku.ai.mcts import GomokuState, allocateTime
+from gomoku.ai.engine import Engine, SolverEngine
+from gomoku.ai.threats import threatRollout, bits
+# Module imports
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import argparse
+import math
+import os
+import random
+import time
+
+# Default number of random moves played before the engines take over
+OPENING_PLIES = 4
+
+class ArenaPlayer:
+    # Plays one side of an arena game with the same engine as
+    # MCTSWorker, searching in a single thread
+    def __init__(self, spec, renju=False):
+        self.name = spec
+        options = parseSpec(spec)
+        self.kind = options.pop("engine")
+        if self.kind == "solver":
+            self.engine = SolverEngine(renju, 1, 1)
+        elif self.kind in ("mcts", "random"):
+            self.engine = Engine(renju, 1, 1)
+        else:
+            raise Exception(f"Unknown engine {self.kind}")
+        self.engine.iterations = int(options.pop("iterations", 2000))
+        # Fixed time per move, or a clock with an increment
+        self.moveTime = options.pop("time", None)
+        if self.moveTime is not None:
+            self.moveTime = float(self.moveTime)
+        self.clock = options.pop("clock", None)
+        self.increment = float(options.pop("inc", 0))
+        if self.clock is not None:
+            self.clock = float(self.clock)
+
+        rave = options.pop("rave", None)
+        if rave is not None:
+            self.engine.rave = float(rave)
+        rollout = options.pop("rollout", "random")
+        if rollout == "threat":
+            self.engine.rollout = threatRollout
+        elif rollout == "batch":
+            from gomoku.ai.batch import BatchRollout
+            self.engine.rollout = BatchRollout()
+        elif rollout != "random":
+            raise Exception(f"Unknown rollout {rollout}")
+        # Tree of MCTSNode objects, or a flat ArrayTree
+        tree = options.pop("tree", "node")
+        if tree == "array":
+            if self.engine.rave is not None or self.engine.rollout is not None:
+                raise Exception("Array trees only support random rollouts without RAVE")
+            self.engine.useArrayTree()
+        elif tree != "node":
+            raise Exception(f"Unknown tree {tree}")
+        if options:
+            raise Exception(f"Unknown options {', '.join(options)} for {spec}")
+
+        # Processor time spent choosing moves
+        self.cpuTime = 0
+        self.moves = 0
+
+    def processMove(self, move):
+        self.engine.processMove(move)
+
+    def getMove(self):
+        start = time.process_time()
+        move = self.searchMove()
+        self.cpuTime += time.process_time() - start
+        self.moves += 1
+        return move
+
+    def searchMove(self):
+        if self.kind == "random":
+            state = self.engine.node.state
+            move = state.clone().explore(state.legalMoves)
+            self.engine.processMove(move)
+            return move
+
+        start = time.perf_counter()
+        deadline = None
+        if self.moveTime is not None:
+            deadline = start + self.moveTime
+        elif self.clock is not None:
+            deadline = start + allocateTime(self.clock, self.increment)
+        move = self.engine.getMove(deadline)
+
+        if self.clock is not None:
+            self.clock += self.increment - (time.perf_counter() - start)
+        return move
+
+def parseSpec(spec):
+    # Engines are given as name:key=value,key=value, e.g.
+    # mcts:iterations=500,rave=500, mcts:tree=array or solver:time=0.2
+    name, _, rest = spec.partition(":")
+    options = {"engine": name}
+    for item in filter(None, rest.split(",")):
+        key, _, value = item.partition("=")
+        options[key] = value
+    return options
+
+def randomOpening(plies, renju, rng):
+    # Moves near the centre, played by both engines with each colour
+    state = GomokuState(renju)
+    moves = []
+    for _ in range(plies):
+        legal = list(bits(state.legalMoves))
+        move = rng.choice(legal)
+        state.makeMove(move)
+        moves.append(move)
+    return moves
+
+def playGame(spec1, spec2, opening, renju, seed):
+    # Runs in a worker process. Returns the winner (0 for a draw),
+    # the moves played and the processor time used by each player
+    random.seed(seed)
+    players = {1: ArenaPlayer(spec1, renju), 2: ArenaPlayer(spec2, renju)}
+    state = GomokuState(renju)
+    moves = []
+    for move in opening:
+        state.makeMove(move)
+        for player in players.values():
+            player.processMove(move)
+        moves.append(move)
+
+    while not state.isTerminal():
+        mover = players[state.currentPlayer]
+        move = mover.getMove()
+        players[3 - state.currentPlayer].processMove(move)
+        state.makeMove(move)
+        moves.append(move)
+
+    winner = state.overallWinner or 0
+    return winner, moves, {
+        number: (player.cpuTime, player.moves)
+        for number, player in players.items()
+    }
+
+def scoreToElo(score):
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * math.log10(1 / score - 1)
+
+class Results:
+    # Running totals from the first engine's point of view
+    def __init__(self):
+        self.wins = 0
+        self.losses = 0
+        self.draws = 0
+        self.cpuTime = [0, 0]
+        self.moves = [0, 0]
+
+    @property
+    def games(self):
+        return self.wins + self.losses + self.draws
+
+    def add(self, winner, engineColour, usage):
+        if winner == 0:
+            self.draws += 1
+        elif winner == engineColour:
+            self.wins += 1
+        else:
+            self.losses += 1
+        for number, (cpu, moves) in usage.items():
+            side = 0 if number == engineColour else 1
+            self.cpuTime[side] += cpu
+            self.moves[side] += moves
+
+    def scoreStats(self):
+        # Mean score and its variance per game
+        n = self.games
+        score = (self.wins + self.draws / 2) / n
+        variance = (self.wins * (1 - score)**2 + self.draws * (0.5 - score)**2
+                    + self.losses * score**2) / n
+        return score, variance
+
+    def elo(self):
+        # Elo difference with a 95% confidence margin
+        score, variance = self.scoreStats()
+        elo = scoreToElo(score)
+        margin = math.inf
+        if 0 < score < 1:
+            deviation = math.sqrt(variance / self.games)
+            slope = 400 / (math.log(10) * score * (1 - score))
+            margin = 1.96 * deviation * slope
+        return elo, margin
+
+    def llr(self, elo0, elo1):
+        # Log likelihood ratio of elo1 against elo0, using the
+        # normal approximation to the trinomial GSPRT
+        score, variance = self.scoreStats()
+        if variance == 0:
+            return 0
+        s0 = 1 / (1 + 10**(-elo0 / 400))
+        s1 = 1 / (1 + 10**(-elo1 / 400))
+        return self.games * (s1 - s0) * (2*score - s0 - s1) / (2 * variance)
+
+def sprtBounds(alpha, beta):
+    return math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+
+def runArena(spec1, spec2, games, processes, plies, renju, seed, sprt=None, report=print):
+    # Play games between two engines, with every opening played once
+    # with each colour. sprt is (elo0, elo1, alpha, beta) to stop as
+    # soon as the test passes or fails
+    rng = random.Random(seed)
+    # Check both specs before starting any processes
+    ArenaPlayer(spec1, renju)
+    ArenaPlayer(spec2, renju)
+
+    results = Results()
+    bounds = sprtBounds(*sprt[2:]) if sprt is not None else None
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        pending = {}
+        for i in range(games):
+            # First engine plays black in even games
+            if i % 2 == 0:
+                opening = randomOpening(plies, renju, rng)
+                future = pool.submit(playGame, spec1, spec2, opening, renju, rng.getrandbits(32))
+                pending[future] = 1
+            else:
+                future = pool.submit(playGame, spec2, spec1, opening, renju, rng.getrandbits(32))
+                pending[future] = 2
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                colour = pending.pop(future)
+                winner, _, usage = future.result()
+                results.add(winner, colour, usage)
+            report(formatResults(results, sprt))
+
+            if bounds is not None:
+                llr = results.llr(sprt[0], sprt[1])
+                if not bounds[0] < llr < bounds[1]:
+                    report("SPRT: H1 accepted" if llr >= bounds[1] else "SPRT: H0 accepted")
+                    pool.shutdown(cancel_futures=True)
+                    break
+    return results
+
+def formatResults(results, sprt=None):
+    elo, margin = results.elo()
+    text = (f"Games {results.games}: {results.wins}-{results.losses}-{results.draws}"
+            f"  Elo {elo:+.1f} +/- {margin:.1f}")
+    if sprt is not None:
+        low, high = sprtBounds(*sprt[2:])
+        text += f"  LLR {results.llr(sprt[0], sprt[1]):.2f} [{low:.2f}, {high:.2f}]"
+    return text
+
+def main():
+    parser = argparse.ArgumentParser(description="Play engines against each other without the GUI")
+    parser.add_argument("engine1", help="e.g. mcts:iterations=2000,rave=500")
+    parser.add_argument("engine2", help="e.g. solver:time=0.2")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--opening-plies", type=int, default=OPENING_PLIES)
+    parser.add_argument("--renju", action="store_true")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--sprt", type=float, nargs=2, metavar=("ELO0", "ELO1"),
+                        help="stop once the SPRT between these Elo differences finishes")
+    parser.add_argument("--alpha", type=float, default=0.05)
+    parser.add_argument("--beta", type=float, default=0.05)
+    args = parser.parse_args()
+
+    sprt = None
+    if args.sprt is not None:
+        sprt = (args.sprt[0], args.sprt[1], args.alpha, args.beta)
+    start = time.perf_counter()
+    results = runArena(
+        args.engine1, args.engine2, args.games, args.processes,
+        args.opening_plies, args.renju, args.seed, sprt)
+
+    print(f"Finished in {time.perf_counter() - start:.1f}s")
+    for side, spec in enumerate((args.engine1, args.engine2)):
+        cpu = results.cpuTime[side]
+        moves = max(results.moves[side], 1)
+        print(f"{spec}: {cpu:.1f} CPU seconds, {1000 * cpu / moves:.1f} ms per move")
+
+if __name__ == "__main__":
+    main()
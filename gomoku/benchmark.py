@@ -0,0 +1,177 @@
+# Local imports
+from gomoku.ai.mcts import BOARD_SIZE, GomokuState, MCTSNode, mcts
+from gomoku.ai.arraytree import ArrayTree
+from gomoku.ai.threats import bits
+from gomoku.board import Board
+# Module imports
+import argparse
+import gc
+import json
+import platform
+import random
+import sys
+import time
+
+# Number of moves played to reach each game phase
+PHASES = {"opening": 4, "middle": 20, "late": 50}
+# Board win checks return early before this many moves,
+# so they are only timed in phases at least this long
+BOARD_WIN_PLIES = 9
+# Runs of each benchmark, the fastest is reported
+REPEAT = 7
+# Slowdown compared to a baseline that is reported as a regression
+THRESHOLD = 0.1
+
+def makeMoves(plies, renju=False, seed=0):
+    # The same random game is reached every time for a seed,
+    # skipping seeds where the game ends too early
+    while True:
+        rng = random.Random(seed)
+        state = GomokuState(renju)
+        moves = []
+        while len(moves) < plies and not state.isTerminal():
+            move = rng.choice(list(bits(state.legalMoves)))
+            state.makeMove(move)
+            moves.append(move)
+        if not state.isTerminal():
+            return state, moves
+        seed += 1
+
+def timeStates(state, function, number):
+    # Time function on fresh copies of a state, as moves cannot be undone
+    states = [state.clone() for _ in range(number)]
+    start = time.perf_counter()
+    for copy in states:
+        function(copy)
+    return time.perf_counter() - start
+
+def timeCalls(function, number):
+    start = time.perf_counter()
+    for _ in range(number):
+        function()
+    return time.perf_counter() - start
+
+def makeBenchmarks(phases=PHASES):
+    # Each benchmark is a name, a function taking a repeat count and
+    # returning the time taken, and the count of operations per run
+    benchmarks = []
+    for phase, plies in phases.items():
+        state, moves = makeMoves(plies)
+        move = (state.legalMoves & -state.legalMoves).bit_length() - 1
+        board = Board()
+        for m in moves:
+            board.playPiece(m % BOARD_SIZE, m // BOARD_SIZE)
+
+        def makeMove(number, state=state, move=move):
+            return timeStates(state, lambda s: s.makeMove(move), number)
+
+        def explore(number, state=state):
+            random.seed(0)
+            return timeStates(state, lambda s: s.explore(), number)
+
+        benchmarks += [
+            (f"makeMove/{phase}", makeMove, 10000),
+            (f"calculateLegalMoves/{phase}", lambda n, s=state: timeCalls(s.calculateLegalMoves, n), 10000),
+            (f"checkPiecesWin/{phase}", lambda n, s=state: timeCalls(lambda: s.checkPiecesWin(s.pieces1), n), 10000),
+            (f"explore/{phase}", explore, 10000),
+        ]
+        if plies >= BOARD_WIN_PLIES:
+            benchmarks += [
+                (f"Board.checkWinPiece/{phase}", lambda n, b=board: timeCalls(b.checkWinPiece, n), 10000),
+                (f"Board.checkWin/{phase}", lambda n, b=board: timeCalls(b.checkWin, n), 10000),
+            ]
+
+    for renju in (False, True):
+        for phase, plies in phases.items():
+            state, _ = makeMoves(plies, renju)
+
+            def search(number, state=state):
+                random.seed(0)
+                root = MCTSNode(state.clone())
+                start = time.perf_counter()
+                mcts(root, number)
+                # Scale to the full count, as the search may stop early
+                return (time.perf_counter() - start) * number / root.visits
+
+            name = "mcts/renju" if renju else "mcts"
+            benchmarks.append((f"{name}/{phase}", search, 500))
+
+            def searchArray(number, state=state):
+                random.seed(0)
+                # Arrays are allocated outside the timing
+                tree = ArrayTree(state)
+                start = time.perf_counter()
+                tree.search(number)
+                return time.perf_counter() - start
+
+            name = "arraytree/renju" if renju else "arraytree"
+            benchmarks.append((f"{name}/{phase}", searchArray, 500))
+    return benchmarks
+
+def runBenchmark(function, number, repeat):
+    # Fastest time per operation, with the garbage collector off
+    # as timeit does, after one run to warm up
+    function(number)
+    times = []
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            times.append(function(number) / number)
+    finally:
+        if enabled:
+            gc.enable()
+    return min(times)
+
+def formatTime(seconds):
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.2f} us"
+    return f"{seconds * 1e3:.2f} ms"
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the game and search code")
+    parser.add_argument("--filter", default="", help="only run benchmarks containing this text")
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--scale", type=float, default=1, help="multiply operations per run")
+    parser.add_argument("--save", help="write the results to a baseline file")
+    parser.add_argument("--compare", help="compare the results with a baseline file")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+
+    results = {}
+    regressions = []
+    for name, function, number in makeBenchmarks():
+        if args.filter not in name:
+            continue
+        number = max(1, int(number * args.scale))
+        seconds = runBenchmark(function, number, args.repeat)
+        results[name] = seconds
+
+        line = f"{name:<32} {formatTime(seconds):>12} per op {1 / seconds:>12,.0f}/s"
+        if baseline is not None and name in baseline:
+            change = seconds / baseline[name] - 1
+            line += f"  {change:+.1%}"
+            if change > args.threshold:
+                line += "  SLOWER"
+                regressions.append(name)
+        print(line, flush=True)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({
+                "python": sys.version,
+                "platform": platform.platform(),
+                "results": results,
+            }, f, indent=2)
+        print(f"Saved {len(results)} results to {args.save}")
+    if regressions:
+        print(f"{len(regressions)} benchmarks slower than the baseline by over {args.threshold:.0%}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -2,3 +2,4 @@ BACKGROUND_COLOR = "#deb887"
 BOARD_LINE_COLOR = "#0e131b"
 BLACK_PIECE_COLOR = "#202020"
 WHITE_PIECE_COLOR = "#ebebeb"
+ANALYSIS_COLOR = "#1e6fd9"
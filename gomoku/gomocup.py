@@ -0,0 +1,210 @@
+# Local imports
+from gomoku.ai.mcts import BOARD_SIZE, GomokuState, MCTSNode, TranspositionTable, allocateTime, mcts, TIME_MARGIN, MIN_MOVE_TIME, TABLE_CAPACITY
+# Module imports
+import sys
+import time
+
+# Reply to the ABOUT command
+ABOUT = 'name="gomoku-nea", version="0.1.0", country="GB"'
+
+# Memory used before any search, and a generous estimate of the
+# memory used by each node in the tree, for the max_memory limit
+BASE_MEMORY = 32 * 1024 * 1024
+NODE_BYTES = 1000
+# Fewest iterations worth searching before the tree is discarded
+MIN_ITERATIONS = 1000
+
+# Rule bits sent with INFO rule
+RULE_EXACT_FIVE = 1
+RULE_RENJU = 4
+
+class GomocupPlayer:
+    # Plays one side of a game for a Gomocup manager (such as Piskvork),
+    # which sends commands on stdin and reads replies from stdout.
+    # Only gomoku.ai.mcts is imported, so the engine starts quickly
+    def __init__(self, output=print):
+        self.output = output
+        # Limits sent with INFO, in seconds and bytes, None for no limit
+        self.turnTime = 30
+        self.matchTime = None
+        self.timeLeft = None
+        self.maxMemory = None
+        self.renju = False
+        self.newGame()
+
+    def newGame(self):
+        self.moves = []
+        self.state = GomokuState(self.renju)
+        self.newTree()
+
+    def newTree(self):
+        # Nodes are only ever added by searching, so the nodes added
+        # since the tree was started bound its size
+        self.node = MCTSNode(self.state.clone())
+        limit = self.nodeLimit()
+        self.table = TranspositionTable(TABLE_CAPACITY if limit is None else limit)
+        self.treeNodes = 0
+
+    def nodeLimit(self):
+        if self.maxMemory is None:
+            return None
+        return max((self.maxMemory - BASE_MEMORY) // NODE_BYTES, MIN_ITERATIONS)
+
+    def play(self, move):
+        if (self.state.pieces1 | self.state.pieces2) >> move & 1:
+            raise Exception(f"{move % BOARD_SIZE},{move // BOARD_SIZE} is already taken")
+        self.state.makeMove(move)
+        self.moves.append(move)
+        self.node = self.node.getNextNode(move, self.table)
+
+    def think(self, start):
+        # Search within the turn and match time left, and within the
+        # nodes the memory limit allows
+        budget = self.turnTime - TIME_MARGIN
+        if self.timeLeft is not None:
+            budget = min(budget, allocateTime(self.timeLeft, 0))
+        deadline = start + max(budget, MIN_MOVE_TIME)
+
+        iterations = None
+        limit = self.nodeLimit()
+        if limit is not None:
+            if limit - self.treeNodes < MIN_ITERATIONS:
+                self.newTree()
+            iterations = limit - self.treeNodes
+
+        visits = self.node.visits
+        move = mcts(self.node, iterations, deadline, self.table)
+        self.treeNodes += self.node.visits - visits
+        self.play(move)
+        return move
+
+    def reply(self, start):
+        if self.state.isTerminal():
+            self.output("ERROR the game has already ended")
+            return
+        move = self.think(start)
+        self.output(f"{move % BOARD_SIZE},{move // BOARD_SIZE}")
+
+    def info(self, key, value):
+        # Times are given in milliseconds, 0 meaning as fast as
+        # possible for a turn and no limit for the match
+        if key == "timeout_turn":
+            self.turnTime = int(value) / 1000
+        elif key == "timeout_match":
+            self.matchTime = int(value) / 1000 or None
+        elif key == "time_left":
+            if self.matchTime is not None:
+                self.timeLeft = int(value) / 1000
+        elif key == "max_memory":
+            self.maxMemory = int(value) or None
+            self.newTree()
+        elif key == "rule":
+            rule = int(value)
+            if rule & RULE_EXACT_FIVE:
+                self.output("MESSAGE exactly five is not supported, overlines also win")
+            self.renju = bool(rule & RULE_RENJU)
+            self.state.renju = self.renju
+            self.state.calculateLegalMoves()
+            self.newTree()
+
+    def setBoard(self, stones):
+        # Stones are (move, field), field 1 being ours and 2 the
+        # opponent's. The order they were played in is not known,
+        # so black and white stones are played alternately
+        own = [move for move, field in stones if field == 1]
+        opponent = [move for move, field in stones if field == 2]
+        if len(own) == len(opponent):
+            black, white = own, opponent
+        elif len(opponent) == len(own) + 1:
+            black, white = opponent, own
+        else:
+            raise Exception("it is not our turn on this board")
+
+        self.newGame()
+        for i, move in enumerate(black):
+            self.state.makeMove(move)
+            self.moves.append(move)
+            if i < len(white):
+                self.state.makeMove(white[i])
+                self.moves.append(white[i])
+        self.newTree()
+
+    def takeBack(self, move):
+        # Only the last move can be taken back, taking back an earlier
+        # one would change the colour of every stone played after it
+        if not self.moves or move != self.moves[-1]:
+            raise Exception("only the last move can be taken back")
+        moves = self.moves[:-1]
+        self.newGame()
+        for m in moves:
+            self.state.makeMove(m)
+            self.moves.append(m)
+        self.newTree()
+
+    def run(self, lines):
+        # Reads commands until END, lines is an iterator of lines
+        for line in lines:
+            words = line.strip().split(maxsplit=1)
+            if not words:
+                continue
+            start = time.perf_counter()
+            command = words[0].upper()
+            argument = words[1] if len(words) > 1 else ""
+            try:
+                if command == "END":
+                    return
+                self.command(command, argument, lines, start)
+            except Exception as error:
+                self.output(f"ERROR {error}")
+
+    def command(self, command, argument, lines, start):
+        if command == "START":
+            if int(argument) != BOARD_SIZE:
+                self.output(f"ERROR only {BOARD_SIZE}x{BOARD_SIZE} boards are supported")
+                return
+            self.newGame()
+            self.output("OK")
+        elif command == "RESTART":
+            self.newGame()
+            self.output("OK")
+        elif command == "BEGIN":
+            self.reply(start)
+        elif command == "TURN":
+            self.play(parseMove(argument))
+            self.reply(start)
+        elif command == "BOARD":
+            stones = []
+            for line in lines:
+                if line.strip().upper() == "DONE":
+                    break
+                x, y, field = (int(value) for value in line.split(","))
+                stones.append((BOARD_SIZE*y + x, field))
+            self.setBoard(stones)
+            self.reply(start)
+        elif command == "TAKEBACK":
+            self.takeBack(parseMove(argument))
+            self.output("OK")
+        elif command == "INFO":
+            key, _, value = argument.partition(" ")
+            self.info(key.lower(), value.strip())
+        elif command == "ABOUT":
+            self.output(ABOUT)
+        else:
+            self.output(f"UNKNOWN {command}")
+
+def parseMove(text):
+    x, y = (int(value) for value in text.split(","))
+    if not (0 <= x < BOARD_SIZE and 0 <= y < BOARD_SIZE):
+        raise Exception(f"move {text} is off the board")
+    return BOARD_SIZE*y + x
+
+def main():
+    def output(text):
+        # Managers read replies line by line as they are written
+        sys.stdout.write(text + "\n")
+        sys.stdout.flush()
+
+    GomocupPlayer(output).run(sys.stdin)
+
+if __name__ == "__main__":
+    main()
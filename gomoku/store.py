@@ -0,0 +1,345 @@
+# Local imports
+from gomoku.ai.mcts import BOARD_SIZE, zobrist
+from gomoku.ai.book import canonicalKey, symmetries
+# Module imports
+from array import array
+import argparse
+import glob
+import heapq
+import mmap
+import os
+import struct
+import time
+
+# Default location of the games saved by GameBrowser
+STORE_PATH = os.path.join(os.path.expanduser("~"), ".gomoku", "games")
+
+# Data file layout: magic, then games appended one after another,
+# each a header followed by its moves as one byte per cell
+MAGIC = b"GGS1"
+# Winner (0 for a draw or unfinished game), flags, move count and time
+GAME_HEADER = struct.Struct("<BBHI")
+# Flags stored with each game
+RENJU = 1
+# The index file is the offset of every game in the data file,
+# as unsigned 64-bit integers, so it can be read in one call
+INDEX_TYPE = "Q"
+
+class GameRecord:
+    def __init__(self, moves, winner=0, renju=False, played=None):
+        # Moves are cells as used by GomokuState, 15*y + x
+        self.moves = list(moves)
+        self.winner = winner
+        self.renju = renju
+        # Seconds since the epoch when the game was saved
+        self.played = int(time.time()) if played is None else played
+
+    def encode(self):
+        flags = RENJU if self.renju else 0
+        header = GAME_HEADER.pack(self.winner, flags, len(self.moves), self.played)
+        return header + bytes(self.moves)
+
+def decodeGame(data, offset=0):
+    # Game record starting at offset within data
+    winner, flags, count, played = GAME_HEADER.unpack_from(data, offset)
+    start = offset + GAME_HEADER.size
+    moves = data[start:start + count]
+    if len(moves) != count:
+        raise Exception("Game record is truncated")
+    return GameRecord(moves, winner, bool(flags & RENJU), played)
+
+class GameStore:
+    # Append-only store of finished games. Games are only ever added at
+    # the end of the data file, and their offsets at the end of the
+    # index, so single games are read with one seek and bulk loads read
+    # each file once
+    def __init__(self, path=STORE_PATH):
+        self.dataPath = path + ".dat"
+        self.indexPath = path + ".idx"
+        folder = os.path.dirname(self.dataPath)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+        if not os.path.exists(self.dataPath):
+            with open(self.dataPath, "wb") as f:
+                f.write(MAGIC)
+        self.data = open(self.dataPath, "r+b")
+        if self.data.read(len(MAGIC)) != MAGIC:
+            self.data.close()
+            raise Exception(f"{self.dataPath} is not a game store")
+
+        self.offsets = array(INDEX_TYPE)
+        if os.path.exists(self.indexPath):
+            with open(self.indexPath, "rb") as f:
+                data = f.read()
+            # Drop a partly written offset at the end of the index
+            size = self.offsets.itemsize
+            self.offsets.frombytes(data[:len(data) - len(data) % size])
+            # and any offsets of games not fully written to the data file
+            end = self.data.seek(0, os.SEEK_END)
+            valid = len(self.offsets)
+            while valid:
+                offset = self.offsets[valid - 1]
+                if offset + GAME_HEADER.size <= end:
+                    self.data.seek(offset)
+                    count = GAME_HEADER.unpack(self.data.read(GAME_HEADER.size))[2]
+                    if offset + GAME_HEADER.size + count <= end:
+                        break
+                valid -= 1
+            if valid < len(self.offsets) or len(data) % size:
+                del self.offsets[valid:]
+                with open(self.indexPath, "wb") as f:
+                    f.write(self.offsets.tobytes())
+        self.recover()
+
+    def close(self):
+        self.data.close()
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def recover(self):
+        # Index any games written after the last indexed one, as
+        # happens if the program stopped between the two writes
+        size = self.data.seek(0, os.SEEK_END)
+        offset = len(MAGIC)
+        if self.offsets:
+            offset = self.offsets[-1]
+            self.data.seek(offset)
+            count = GAME_HEADER.unpack(self.data.read(GAME_HEADER.size))[2]
+            offset += GAME_HEADER.size + count
+
+        found = array(INDEX_TYPE)
+        while offset + GAME_HEADER.size <= size:
+            self.data.seek(offset)
+            count = GAME_HEADER.unpack(self.data.read(GAME_HEADER.size))[2]
+            end = offset + GAME_HEADER.size + count
+            if end > size:
+                break
+            found.append(offset)
+            offset = end
+        # Drop a partly written game so the next one follows on
+        self.data.truncate(offset)
+        if found:
+            self.offsets.extend(found)
+            with open(self.indexPath, "ab") as f:
+                f.write(found.tobytes())
+
+    def append(self, game):
+        return self.extend([game])[0]
+
+    def extend(self, games):
+        # Write many games with one write to each file,
+        # returning their numbers in the store
+        offset = self.data.seek(0, os.SEEK_END)
+        first = len(self.offsets)
+        chunks = []
+        added = array(INDEX_TYPE)
+        for game in games:
+            chunk = game.encode()
+            chunks.append(chunk)
+            added.append(offset)
+            offset += len(chunk)
+
+        # Data first, so the index never points past the end
+        self.data.write(b"".join(chunks))
+        self.data.flush()
+        with open(self.indexPath, "ab") as f:
+            f.write(added.tobytes())
+        self.offsets.extend(added)
+        return list(range(first, len(self.offsets)))
+
+    def __getitem__(self, number):
+        # Reads a single game without touching the rest of the file
+        self.data.seek(self.offsets[number])
+        header = self.data.read(GAME_HEADER.size)
+        count = GAME_HEADER.unpack(header)[2]
+        return decodeGame(header + self.data.read(count))
+
+    def games(self):
+        # Every game in order, reading the data file in one go
+        self.data.seek(0)
+        data = self.data.read()
+        for offset in self.offsets:
+            yield decodeGame(data, offset)
+
+# Position index segments: magic, first game, game count and record
+# count, then records sorted by key
+INDEX_MAGIC = b"GPI1"
+SEGMENT_HEADER = struct.Struct("<4sIII")
+# Position key, game number and number of moves played
+POSITION = struct.Struct("<QIH")
+
+def gamePositions(number, game):
+    # Canonical key of the position after each move, keeping a hash
+    # for every symmetry up to date rather than hashing from scratch
+    hashes = [0] * len(symmetries)
+    for ply, move in enumerate(game.moves):
+        keys = zobrist[ply % 2]
+        for symmetry, mapping in enumerate(symmetries):
+            hashes[symmetry] ^= keys[mapping[move]]
+        yield min(hashes), number, ply + 1
+
+class Segment:
+    # Sorted run of positions for a range of games, memory-mapped
+    # and binary searched as the opening book is
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.firstGame, self.gameCount, self.count = SEGMENT_HEADER.unpack_from(self.data, 0)
+        if magic != INDEX_MAGIC:
+            self.close()
+            raise Exception(f"{path} is not a position index")
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def keyAt(self, index):
+        return struct.unpack_from("<Q", self.data, SEGMENT_HEADER.size + index*POSITION.size)[0]
+
+    def find(self, key):
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.keyAt(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        found = []
+        while low < self.count:
+            recordKey, game, ply = POSITION.unpack_from(
+                self.data, SEGMENT_HEADER.size + low*POSITION.size)
+            if recordKey != key:
+                break
+            found.append((game, ply))
+            low += 1
+        return found
+
+    def records(self):
+        return POSITION.iter_unpack(self.data[SEGMENT_HEADER.size:])
+
+def writeSegment(path, firstGame, gameCount, records):
+    # Written to a temporary file first, so a segment is
+    # either complete or missing
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as f:
+        # Records are streamed, so the count is filled in at the end
+        f.write(SEGMENT_HEADER.pack(INDEX_MAGIC, firstGame, gameCount, 0))
+        count = 0
+        chunk = []
+        for record in records:
+            chunk.append(POSITION.pack(*record))
+            if len(chunk) == 65536:
+                f.write(b"".join(chunk))
+                count += len(chunk)
+                chunk = []
+        f.write(b"".join(chunk))
+        count += len(chunk)
+        f.seek(0)
+        f.write(SEGMENT_HEADER.pack(INDEX_MAGIC, firstGame, gameCount, count))
+    os.replace(temporary, path)
+    return Segment(path)
+
+class PositionIndex:
+    # Games and move numbers where each position occurred, with
+    # positions that are symmetries of each other sharing a key.
+    # New games are written as a small sorted segment, and segments
+    # of similar size are merged, so adding games never rebuilds the
+    # whole index and a lookup only searches a few segments
+    def __init__(self, path=STORE_PATH):
+        self.path = path
+        self.segments = []
+        for segmentPath in sorted(glob.glob(glob.escape(path) + ".*.pos")):
+            segment = Segment(segmentPath)
+            # Segments must follow on from each other
+            if segment.firstGame != self.gameCount:
+                segment.close()
+                os.remove(segmentPath)
+                continue
+            self.segments.append(segment)
+
+    @property
+    def gameCount(self):
+        if not self.segments:
+            return 0
+        last = self.segments[-1]
+        return last.firstGame + last.gameCount
+
+    def close(self):
+        for segment in self.segments:
+            segment.close()
+        self.segments = []
+
+    def segmentPath(self, firstGame):
+        return f"{self.path}.{firstGame:010d}.pos"
+
+    def update(self, store):
+        # Index the games added to the store since the last update
+        first = self.gameCount
+        if first >= len(store):
+            return
+        records = []
+        for number in range(first, len(store)):
+            records.extend(gamePositions(number, store[number]))
+        records.sort()
+        self.segments.append(writeSegment(
+            self.segmentPath(first), first, len(store) - first, records))
+        self.mergeSegments()
+
+    def mergeSegments(self):
+        # Merge the newest segment into the one before while
+        # they are of a similar size, keeping O(log n) segments
+        while len(self.segments) > 1:
+            older, newer = self.segments[-2], self.segments[-1]
+            if older.count > 2 * newer.count:
+                break
+            merged = heapq.merge(older.records(), newer.records())
+            segment = writeSegment(
+                self.segmentPath(older.firstGame) + ".new", older.firstGame,
+                older.gameCount + newer.gameCount, merged)
+            older.close()
+            newer.close()
+            segment.close()
+            os.replace(segment.path, older.path)
+            os.remove(newer.path)
+            self.segments[-2:] = [Segment(older.path)]
+
+    def find(self, pieces1, pieces2):
+        # Games and move numbers reaching the position, in any symmetry
+        key = canonicalKey(pieces1, pieces2)[0]
+        found = []
+        for segment in self.segments:
+            found.extend(segment.find(key))
+        return found
+
+def formatMove(move):
+    # Moves are written as in the move history, e.g. h8
+    return chr(move % BOARD_SIZE + 97) + str(move // BOARD_SIZE + 1)
+
+def main():
+    parser = argparse.ArgumentParser(description="Show or export saved games")
+    parser.add_argument("path", nargs="?", default=STORE_PATH)
+    parser.add_argument("--show", type=int, help="print the moves of one game")
+    parser.add_argument("--export", help="write every game as a text record, as read by gomoku.ai.book")
+    args = parser.parse_args()
+
+    store = GameStore(args.path)
+    if args.show is not None:
+        game = store[args.show]
+        print(" ".join(formatMove(move) for move in game.moves))
+        print(f"Winner {game.winner or 'none'}, {'Renju' if game.renju else 'Freestyle'}, "
+              f"saved {time.ctime(game.played)}")
+    elif args.export:
+        with open(args.export, "w") as f:
+            for game in store.games():
+                f.write(" ".join(formatMove(move) for move in game.moves) + "\n")
+        print(f"Wrote {len(store)} games to {args.export}")
+    else:
+        print(f"{len(store)} games in {store.dataPath}")
+    store.close()
+
+if __name__ == "__main__":
+    main()
@@ -3,8 +3,9 @@ from gomoku.colors import *
 from gomoku.board import Board
 from gomoku.views.abc import InterfaceView
 from gomoku.views.game import BoardWidget
+from gomoku.store import GameStore, GameRecord, PositionIndex
 # Module imports
-from PySide6.QtWidgets import QHBoxLayout, QVBoxLayout, QWidget, QLabel, QFrame, QGridLayout, QPushButton, QListWidget, QSpacerItem, QSizePolicy, QListWidgetItem
+from PySide6.QtWidgets import QHBoxLayout, QVBoxLayout, QWidget, QLabel, QFrame, QGridLayout, QPushButton, QListWidget, QSpacerItem, QSizePolicy, QListWidgetItem, QMessageBox
 from PySide6.QtGui import QFont, Qt
 from PySide6.QtCore import Slot, QTimer, QElapsedTimer
 
@@ -19,6 +20,7 @@ class GameBrowser(InterfaceView):
         # Timers for each player
         self.playerTimer1 = 300
         self.playerTimer2 = 300
+        self.increment = 0
         self.elapsedTimer = QElapsedTimer()
 
         self.timerRunning = True
@@ -31,6 +33,7 @@ class GameBrowser(InterfaceView):
         USERNAME_FONT = QFont("Noto Sans JP", 14)
         RATING_FONT = QFont("Noto Sans JP", 8)
         BUTTON_HISTORY_FONT = QFont("Noto Sans JP", 12)
+        SEARCH_FONT = QFont("Noto Sans JP", 10)
 
         # Set up widget and layout
         super(InterfaceView, self).__init__()
@@ -106,6 +109,10 @@ class GameBrowser(InterfaceView):
         self.resign = QPushButton("Resign")
         self.buttonlayout.addWidget(self.resign)
         self.resign.setFont(BUTTON_HISTORY_FONT)
+        self.find = QPushButton("Find")
+        self.buttonlayout.addWidget(self.find)
+        self.find.setFont(BUTTON_HISTORY_FONT)
+        self.find.pressed.connect(self.findGames)
 
         # Add move history title
         self.title3 = QLabel("Move history")
@@ -117,8 +124,19 @@ class GameBrowser(InterfaceView):
         self.vlayout.addWidget(self.history)
         self.history.setFont(BUTTON_HISTORY_FONT)
 
+        # Add search statistics from AI players
+        self.title4 = QLabel("Search")
+        self.vlayout.addWidget(self.title4)
+        self.title4.setFont(TITLE_TIMER_FONT)
+        self.title4.setAlignment(Qt.AlignmentFlag.AlignCenter)
+
+        self.searchStats = QLabel()
+        self.vlayout.addWidget(self.searchStats)
+        self.searchStats.setFont(SEARCH_FONT)
+        self.searchStats.setWordWrap(True)
+
         # Create spacers
-        for position, height in [(0, 40), (3, 20), (6, 20), (9, 40)]:
+        for position, height in [(0, 40), (3, 20), (6, 20), (9, 20), (12, 40)]:
             item = QSpacerItem(
                 20, height,
                 QSizePolicy.Policy.Minimum, QSizePolicy.Policy.Expanding)
@@ -131,6 +149,12 @@ class GameBrowser(InterfaceView):
         self.boardWidget.playerPlayed1.connect(self.changePlayer)
         self.boardWidget.playerPlayed2.connect(self.changePlayer)
         self.boardWidget.gameEnded.connect(self.stopTimers)
+        self.boardWidget.gameEnded.connect(self.saveGame)
+
+        # Finished games are added to the store, and the positions
+        # they reached to the index, both opened when first needed
+        self.store = None
+        self.positions = None
 
         # Set initial label text
         self.updateLabels()
@@ -173,8 +197,22 @@ class GameBrowser(InterfaceView):
         if self.timerRunning:
             if self.board.getCurrentPlayer() == 2:
                 self.playerTimer1 -= self.elapsedTimer.restart() / 1000
+                self.playerTimer1 += self.increment
             else:
                 self.playerTimer2 -= self.elapsedTimer.restart() / 1000
+                self.playerTimer2 += self.increment
+            self.updateWorkerClocks()
+
+    def updateWorkerClocks(self):
+        # Give AI players their remaining time before they are
+        # asked for a move, so they can budget their search
+        for number, worker in self.boardWidget.workers.items():
+            if worker is None:
+                continue
+            if number == 1:
+                worker.setClock(self.playerTimer1, self.increment)
+            else:
+                worker.setClock(self.playerTimer2, self.increment)
 
     def updateTimerText(self):
         if self.board.getCurrentPlayer() == 1:
@@ -191,14 +229,58 @@ class GameBrowser(InterfaceView):
         seconds = int(seconds % 60)
         return f"{minutes:>02}:{seconds:>02}"
 
+    @Slot(object)
+    def showSearchStats(self, stats):
+        self.searchStats.setText(stats.summary())
+
+    @Slot(str)
+    def showSearchError(self, message):
+        self.searchStats.setText(message)
+
     @Slot()
     def stopTimers(self):
         self.updateTimer.stop()
         self.elapsedTimer.restart()
         self.updateLabels()
 
+    def openStore(self):
+        if self.store is None:
+            self.store = GameStore()
+            self.positions = PositionIndex()
+            # Catch up with games saved before the index existed
+            self.positions.update(self.store)
+
+    @Slot()
+    def saveGame(self):
+        self.openStore()
+        winner = self.board.checkWinPiece()
+        moves = [15*y + x for x, y in self.board.history]
+        self.store.append(GameRecord(moves, max(winner, 0), self.board.renju))
+        self.positions.update(self.store)
+
+    @Slot()
+    def findGames(self):
+        # List the saved games that reached the current position
+        self.openStore()
+        state = self.board.state
+        found = self.positions.find(state.pieces1, state.pieces2)
+        if found:
+            lines = [f"Game {game + 1}, move {ply}" for game, ply in found[:20]]
+            if len(found) > 20:
+                lines.append(f"and {len(found) - 20} more")
+            text = f"{len(found)} saved games reached this position:\n" + "\n".join(lines)
+        else:
+            text = "No saved games reached this position"
+
+        box = QMessageBox()
+        box.setWindowTitle("Find games")
+        box.setText(text)
+        box.exec()
+
     def reset(self):
+        self.searchStats.clear()
         self.elapsedTimer.restart()
         self.updateTimer.stop()
         self.updateTimer.start()
+        self.updateWorkerClocks()
         self.boardWidget.requestMove1.emit()
@@ -1,12 +1,17 @@
 # Local imports
 from gomoku.colors import *
 from gomoku.views.abc import InterfaceView
-from gomoku.ai.mcts import GomokuState, MCTSNode, mcts
+from gomoku.ai.mcts import allocateTime, SearchStats, AnalysisThrottle, topMoves
+from gomoku.ai.engine import Engine, SolverEngine
+from gomoku.ai.service import EngineService, ServiceTask
+from gomoku.ai.book import loadBook
+from gomoku.ai.threats import bits
 # Module imports
 from PySide6.QtWidgets import QMessageBox, QApplication
-from PySide6.QtGui import QPainter, Qt, QBrush, QColor
-from PySide6.QtCore import QPoint, QObject, Signal, Slot, QThread, QTimer
+from PySide6.QtGui import QPainter, Qt, QBrush, QColor, QPixmap, QFont
+from PySide6.QtCore import QPoint, QRect, QObject, Signal, Slot, QTimer
 import math
+import time
 
 class BoardWidget(InterfaceView):
     playerPlayed1 = Signal(int, int)
@@ -35,10 +40,26 @@ class BoardWidget(InterfaceView):
         self.workers = {1: None, 2: None}
         self.gameEnd = False
 
+        # Cached layers, the board is only drawn again when the pixel
+        # ratio changes and the pieces when they change
+        self.boardLayer = None
+        self.pieceLayer = None
+        self.pieceKey = None
+
+        # Candidate moves from the searching AI player, as
+        # (move, share of visits, win rate)
+        self.analysis = []
+        self.showAnalysis = True
+
     def assignWorker(self, worker, number):
+        self.removeWorker(number)
         worker.finished.connect(self.playPiece)
+        worker.analysis.connect(self.setAnalysis)
         self.workers[number] = worker
 
+        # Workers live in this thread and hand searches
+        # to the engine service, so they never block it
+        self.gameEnded.connect(worker.stopPondering)
         if number == 1:
             self.playerPlayed1.connect(worker.processMove)
             self.requestMove1.connect(worker.getMove)
@@ -46,9 +67,27 @@ class BoardWidget(InterfaceView):
             self.playerPlayed2.connect(worker.processMove)
             self.requestMove2.connect(worker.getMove)
 
+    def removeWorker(self, number):
+        # Disconnect a worker from a previous game and release its engine
+        worker = self.workers[number]
+        if worker is None:
+            return
+        worker.finished.disconnect(self.playPiece)
+        worker.analysis.disconnect(self.setAnalysis)
+        self.gameEnded.disconnect(worker.stopPondering)
+        if number == 1:
+            self.playerPlayed1.disconnect(worker.processMove)
+            self.requestMove1.disconnect(worker.getMove)
+        else:
+            self.playerPlayed2.disconnect(worker.processMove)
+            self.requestMove2.disconnect(worker.getMove)
+        worker.release()
+        self.workers[number] = None
+
     def reset(self):
         self.cursorCell = None
         self.enableInput = True
+        self.analysis = []
 
     def paintEvent(self, event):
         # Handle event and create painter object
@@ -62,10 +101,46 @@ class BoardWidget(InterfaceView):
         y = (self.height() - size) / 2
         painter.setViewport(x, y, size, size)
 
-        self.drawBoard(painter)
+        # Only the region given by the event is actually painted
+        painter.drawPixmap(0, 0, self.getBoardLayer())
+        painter.drawPixmap(0, 0, self.getPieceLayer())
+        if self.showAnalysis:
+            self.drawAnalysis(painter)
         if self.enableInput:
             self.drawCursor(painter)
 
+    def makeLayer(self):
+        # Transparent pixmap covering the board at full resolution
+        ratio = self.devicePixelRatioF()
+        layer = QPixmap(round(600 * ratio), round(600 * ratio))
+        layer.setDevicePixelRatio(ratio)
+        layer.fill(Qt.GlobalColor.transparent)
+        return layer
+
+    def getBoardLayer(self):
+        ratio = self.devicePixelRatioF()
+        if self.boardLayer is None or self.boardLayer.devicePixelRatio() != ratio:
+            self.boardLayer = self.makeLayer()
+            painter = QPainter(self.boardLayer)
+            painter.setRenderHint(QPainter.RenderHint.Antialiasing, True)
+            self.drawBoard(painter)
+            painter.end()
+        return self.boardLayer
+
+    def getPieceLayer(self):
+        # Pieces are drawn again after moves and undos, which
+        # are both seen as a change in the bitboards
+        state = self.board.state
+        key = (state.pieces1, state.pieces2, self.devicePixelRatioF())
+        if key != self.pieceKey:
+            self.pieceLayer = self.makeLayer()
+            painter = QPainter(self.pieceLayer)
+            painter.setRenderHint(QPainter.RenderHint.Antialiasing, True)
+            self.drawPieces(painter)
+            painter.end()
+            self.pieceKey = key
+        return self.pieceLayer
+
     def drawBoard(self, painter):
         # Draw background
         painter.fillRect(0, 0, 600, 600, BACKGROUND_COLOR)
@@ -86,26 +161,52 @@ class BoardWidget(InterfaceView):
         painter.drawEllipse(QPoint(460, 460), 4, 4)
         painter.drawEllipse(QPoint(300, 300), 4, 4)
 
-        # Draw pieces
-        for y in range(15):
-            for x in range(15):
-                piece = self.board.getPiece(x, y)
-                if piece == 1:
-                    painter.setBrush(QBrush(BLACK_PIECE_COLOR))
-                elif piece == 2:
-                    painter.setBrush(QBrush(WHITE_PIECE_COLOR))
-                else:
-                    continue
-
+    def drawPieces(self, painter):
+        # Draw each player's pieces with a single brush
+        painter.setPen(Qt.PenStyle.NoPen)
+        state = self.board.state
+        for pieces, color in ((state.pieces1, BLACK_PIECE_COLOR), (state.pieces2, WHITE_PIECE_COLOR)):
+            painter.setBrush(QBrush(color))
+            for move in bits(pieces):
+                x, y = move % 15, move // 15
                 # Qt coordinate system has (0, 0) at top left
                 pos = QPoint(20 + x*40, 600 - (20 + y*40))
                 painter.drawEllipse(pos, 15, 15)
 
+    def drawAnalysis(self, painter):
+        # Circles sized by share of visits, labelled with win rate
+        if not self.analysis:
+            return
+        painter.setFont(QFont("Noto Sans JP", 7))
+        color = QColor(ANALYSIS_COLOR)
+        color.setAlpha(170)
+        maxShare = max(share for _, share, _ in self.analysis)
+        for move, share, winRate in self.analysis:
+            x, y = move % 15, move // 15
+            pos = QPoint(20 + x*40, 600 - (20 + y*40))
+            radius = round(8 + 10 * share / maxShare)
+            painter.setPen(Qt.PenStyle.NoPen)
+            painter.setBrush(QBrush(color))
+            painter.drawEllipse(pos, radius, radius)
+            painter.setPen(QColor(WHITE_PIECE_COLOR))
+            painter.drawText(
+                QRect(pos.x() - 20, pos.y() - 20, 40, 40),
+                Qt.AlignmentFlag.AlignCenter, f"{winRate:.0%}")
+        painter.setPen(Qt.PenStyle.NoPen)
+
+    @Slot(object)
+    def setAnalysis(self, analysis):
+        # Snapshots arrive at a limited rate, and only the cells
+        # of the old and new candidates are painted again
+        for move, _, _ in self.analysis + analysis:
+            self.update(self.cellRect((move % 15, move // 15)))
+        self.analysis = analysis
+
     def drawCursor(self, painter):
         # Draw cursor piece (if possible)
         if self.cursorCell is not None:
             x, y = self.cursorCell
-            if self.board.positionEmpty(x, y):
+            if self.board.positionEmpty(x, y) and not self.board.positionForbidden(x, y):
                 if self.board.currentPlayer == 1:
                     color = QColor(BLACK_PIECE_COLOR)
                 else:
@@ -122,26 +223,46 @@ class BoardWidget(InterfaceView):
         size = min(event.size().width(), event.size().height())
         self.resize(size, size)
 
+    def cellRect(self, cell):
+        # Area of the widget covered by a cell, for partial repaints
+        size = min(self.width(), self.height())
+        cellSize = size / 15
+        x, y = cell
+        left = (self.width() - size) / 2 + x * cellSize
+        top = (self.height() - size) / 2 + (14 - y) * cellSize
+        # Grow by a pixel to cover antialiasing at the edges
+        return QRect(
+            math.floor(left) - 1, math.floor(top) - 1,
+            math.ceil(cellSize) + 2, math.ceil(cellSize) + 2)
+
+    def setCursorCell(self, cell):
+        # Only the old and new cells need to be painted again
+        if cell == self.cursorCell:
+            return
+        for changed in (self.cursorCell, cell):
+            if changed is not None:
+                self.update(self.cellRect(changed))
+        self.cursorCell = cell
+
     def mouseMoveEvent(self, event):
         # Store the position of the cell that the mouse is hovering over
         super(BoardWidget, self).mouseMoveEvent(event)
         pos = event.position()
         cellSize = self.width() / 15
-        self.cursorCell = (
+        cell = (
             math.floor(pos.x() / cellSize),
             math.floor(15 - pos.y() / cellSize)
         )
-        if self.cursorCell[0] < 0 or self.cursorCell[0] > 14:
-            self.cursorCell = None
-        elif self.cursorCell[1] < 0 or self.cursorCell[1] > 14:
-            self.cursorCell = None
-        self.update()
+        if cell[0] < 0 or cell[0] > 14:
+            cell = None
+        elif cell[1] < 0 or cell[1] > 14:
+            cell = None
+        self.setCursorCell(cell)
 
     def leaveEvent(self, event):
         # Reset the hovered cell
         super(BoardWidget, self).leaveEvent(event)
-        self.cursorCell = None
-        self.update()
+        self.setCursorCell(None)
 
     def mouseReleaseEvent(self, event):
         super(BoardWidget, self).mouseReleaseEvent(event)
@@ -151,7 +272,10 @@ class BoardWidget(InterfaceView):
 
     @Slot(int, int)
     def playPiece(self, x, y):
-        self.board.playPiece(x, y)
+        # Forbidden moves under Renju rules are not played
+        if not self.board.playPiece(x, y):
+            return
+        self.analysis = []
         self.update()
 
         currentPlayer = self.board.getCurrentPlayer()
@@ -197,19 +321,36 @@ class BoardWidget(InterfaceView):
         # Show box
         box.exec()
 
+# Engine service shared by every AI player, created on first use
+service = None
+
+def getService():
+    global service
+    if service is None:
+        service = EngineService()
+        QApplication.instance().aboutToQuit.connect(service.shutdown)
+    return service
+
 class WorkerBase(QObject):
     finished = Signal(int, int)
 
     def __init__(self):
         super(WorkerBase, self).__init__()
-        self.workerThread = QThread()
-        QApplication.instance().aboutToQuit.connect(self.cleanup)
-        self.moveToThread(self.workerThread)
-        self.workerThread.start()
+        # Remaining time on this player's clock, None if untimed
+        self.timeRemaining = None
+        self.increment = 0
 
-    def cleanup(self):
-        self.workerThread.terminate()
-        self.workerThread.wait()
+    def release(self):
+        # Called when the worker is no longer used by a board
+        pass
+
+    def stopPondering(self):
+        pass
+
+    def setClock(self, remaining, increment):
+        # Called from the GUI thread before a move is requested
+        self.timeRemaining = remaining
+        self.increment = increment
 
     def processMove(self, x, y):
         pass
@@ -218,16 +359,109 @@ class WorkerBase(QObject):
         pass
 
 class MCTSWorker(WorkerBase):
-    def __init__(self):
+    # SearchStats for each move searched, when stats is enabled
+    searchInfo = Signal(object)
+    # Best candidate moves while searching, from topMoves
+    analysis = Signal(object)
+    # Description of a search that failed, was cancelled or timed out
+    searchError = Signal(str)
+    # Engine doing the search, run by the engine service
+    engineClass = Engine
+
+    def __init__(self, processes=None, threads=None, renju=False):
         super(MCTSWorker, self).__init__()
-        self.node = MCTSNode(GomokuState())
+        self.service = getService()
+        # Opening book consulted before searching, if one exists
+        self.engine = self.engineClass(renju, processes, threads, loadBook(), self.service.pool)
+        self.released = False
+
+        # Keep searching on the opponent's time
+        self.ponder = True
+        # Record search statistics for display
+        self.stats = True
+        # Send snapshots of the candidate moves while searching
+        self.streamAnalysis = True
+
+    def release(self):
+        # Stop any search, then close the engine once its
+        # earlier tasks have finished
+        if self.released:
+            return
+        self.released = True
+        self.service.cancel(self.engine)
+        self.service.submit(self.engine, ServiceTask(lambda task: self.engine.close()))
 
     @Slot(int, int)
     def processMove(self, x, y):
-        self.node = self.node.getNextNode(15*y+x)
+        if self.released:
+            return
+        move = 15*y + x
+        self.service.submit(self.engine, ServiceTask(lambda task: self.engine.processMove(move)))
 
     @Slot()
     def getMove(self):
-        move = mcts(self.node, 2000)
-        self.node = self.node.getNextNode(move)
-        self.finished.emit(move % 15, move // 15)
+        if self.released:
+            return
+        # Search for a share of the clock when the game is timed,
+        # otherwise use a fixed iteration budget. The task times
+        # out when the clock would run out
+        deadline = None
+        timeout = None
+        if self.timeRemaining is not None:
+            budget = allocateTime(self.timeRemaining, self.increment)
+            deadline = time.perf_counter() + budget
+            timeout = self.timeRemaining
+
+        stats = SearchStats() if self.stats else None
+        progress = AnalysisThrottle(self.sendAnalysis) if self.streamAnalysis else None
+
+        def search(task):
+            return self.engine.getMove(task.capDeadline(deadline), stats, progress, task.stop)
+
+        def searched(task):
+            # Runs on a service thread, signals are queued to the GUI
+            if self.released:
+                return
+            move = task.result
+            if task.error == "cancelled":
+                self.searchError.emit(self.describeError(task.error))
+                return
+            # A search stopped just as it finished has still played its move
+            if move is None:
+                self.searchError.emit(self.describeError(task.error))
+                # Still answer after a timeout or a failed search, so
+                # the game carries on. The engine's tasks run one at a
+                # time, so its tree is not in use
+                move = self.engine.fallbackMove()
+                if move is None:
+                    return
+            # Book and solved moves are found without searching the tree
+            elif stats is not None and stats.iterations:
+                self.searchInfo.emit(stats)
+            # Queue pondering first, so the opponent's reply stops it
+            if self.ponder:
+                self.service.submit(self.engine, ServiceTask(
+                    lambda task: self.engine.ponder(task.stop), ponder=True))
+            self.finished.emit(move % 15, move // 15)
+
+        self.service.submit(self.engine, ServiceTask(search, searched, timeout))
+
+    def describeError(self, error):
+        if error == "cancelled":
+            return "Search cancelled"
+        if error == "timeout":
+            return "Search ran out of time, playing the best move found"
+        return f"Search failed ({error}), playing the best move found"
+
+    def sendAnalysis(self, counts):
+        # Called from within the search, emitting queues the
+        # snapshot for the GUI thread without waiting for it
+        self.analysis.emit(topMoves(counts))
+
+    def stopPondering(self):
+        # Called directly from the GUI thread
+        self.service.cancelPondering(self.engine)
+
+class SolverWorker(MCTSWorker):
+    # Tries the threat-space solver before searching
+    engineClass = SolverEngine
@@ -1,7 +1,7 @@
 # Local imports
 from gomoku.board import Board
 from gomoku.views.abc import InterfaceView
-from gomoku.views.game import BoardWidget, MCTSWorker
+from gomoku.views.game import BoardWidget, MCTSWorker, SolverWorker
 # Module imports
 from PySide6.QtWidgets import QHBoxLayout, QVBoxLayout, QWidget, QLabel, QGridLayout, QComboBox, QCheckBox, QPushButton, QSpacerItem, QSizePolicy
 from PySide6.QtGui import QFont, Qt
@@ -90,10 +90,18 @@ class GameSelection(InterfaceView):
 
         self.checkbox1 = QCheckBox()
         self.gridlayout.addWidget(self.checkbox1, 3, 1)
-        self.checkbox2 = QCheckBox()
-        self.gridlayout.addWidget(self.checkbox2, 4, 1)
-        self.checkbox3 = QCheckBox()
-        self.gridlayout.addWidget(self.checkbox3, 5, 1)
+
+        # AI engine for each player, None for a human player
+        self.combo4 = QComboBox()
+        self.gridlayout.addWidget(self.combo4, 4, 1)
+        self.combo4.setFont(TEXT_FONT)
+        self.combo5 = QComboBox()
+        self.gridlayout.addWidget(self.combo5, 5, 1)
+        self.combo5.setFont(TEXT_FONT)
+        for combo in [self.combo4, self.combo5]:
+            combo.addItem("None", None)
+            combo.addItem("MCTS", MCTSWorker)
+            combo.addItem("Threat solver", SolverWorker)
 
         # Add start button
         self.buttonlayout = QHBoxLayout()
@@ -130,12 +138,23 @@ class GameSelection(InterfaceView):
         view = self.getView("game")
         view.playerTimer1 = self.combo1.currentData()
         view.playerTimer2 = self.combo1.currentData()
-
-        # Add AI player workers when necessary
-        if self.checkbox2.isChecked():
-            view.boardWidget.assignWorker(MCTSWorker(), 1)
-        if self.checkbox3.isChecked():
-            view.boardWidget.assignWorker(MCTSWorker(), 2)
+        view.increment = self.combo2.currentData()
+
+        # Black cannot play forbidden moves under Renju rules
+        renju = self.combo3.currentText() == "Renju"
+        view.board.renju = renju
+
+        # Add AI player workers when necessary, replacing any
+        # left from the previous game
+        for number, combo in ((1, self.combo4), (2, self.combo5)):
+            worker = combo.currentData()
+            if worker is None:
+                view.boardWidget.removeWorker(number)
+            else:
+                worker = worker(renju=renju)
+                view.boardWidget.assignWorker(worker, number)
+                worker.searchInfo.connect(view.showSearchStats)
+                worker.searchError.connect(view.showSearchError)
 
         # Change the current view
         self.navigateTo("game")
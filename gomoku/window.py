@@ -1,41 +1,50 @@
-# Local imports
-from gomoku.views.menu import MainMenuView
-from gomoku.views.select import GameSelection
-from gomoku.views.browser import GameBrowser
 # Module imports
 from PySide6.QtWidgets import QMainWindow
+import importlib
 
 class GomokuWindow(QMainWindow):
+    # Module and class of each view, imported and built the first
+    # time they are used so the menu appears as soon as possible
+    VIEWS = {
+        "menu": ("gomoku.views.menu", "MainMenuView"),
+        "select": ("gomoku.views.select", "GameSelection"),
+        "game": ("gomoku.views.browser", "GameBrowser"),
+    }
+
     def __init__(self):
         super(GomokuWindow, self).__init__()
         # Make window unresizable
         self.setFixedSize(960, 600)
         self.setWindowTitle("GomokuNEA")
 
-        # Lookup table of views
-        self.views = {
-            "menu": MainMenuView(),
-            "select": GameSelection(),
-            "game": GameBrowser(),
-        }
+        # Lookup table of views built so far
+        self.views = {}
         self.currentView = None
 
     def setView(self, name):
-        # Check whether provided view exists
-        if name not in self.views:
-            raise Exception(f"Could not find view {name}")
+        # Take the current view back so it is not deleted with
+        # the window's central widget
+        if self.currentView is not None:
+            self.takeCentralWidget()
 
         # Reset new view
-        self.views[name].reset()
+        view = self.getView(name)
+        view.reset()
 
         # Replace main view
-        self.setCentralWidget(self.views[name])
+        self.setCentralWidget(view)
         self.currentView = name
 
     def getView(self, name):
         # Check whether provided view exists
-        if name not in self.views:
+        if name not in GomokuWindow.VIEWS:
             raise Exception(f"Could not find view {name}")
 
+        # Build the view the first time it is needed
+        if name not in self.views:
+            module, className = GomokuWindow.VIEWS[name]
+            view = getattr(importlib.import_module(module), className)
+            self.views[name] = view()
+
         # Return view with provided name
         return self.views[name]
@@ -0,0 +1,36 @@
+# Local imports
+from gomoku.gomocup import GomocupPlayer
+from gomoku.ai.mcts import GomokuState, TABLE_CAPACITY
+
+def playCommands(commands):
+    replies = []
+    player = GomocupPlayer(replies.append)
+    player.run(iter(commands))
+    return player, replies
+
+def testTakeBack():
+    # Short turns so each reply only searches briefly
+    player, replies = playCommands(["START 15", "INFO timeout_turn 300", "TURN 7,7"])
+    reply = replies[-1]
+    x, y = (int(value) for value in reply.split(","))
+
+    # Only the last move may be taken back
+    player.run(iter(["TAKEBACK 7,7"]))
+    assert replies[-1].startswith("ERROR")
+    assert len(player.moves) == 2
+
+    player.run(iter([f"TAKEBACK {x},{y}"]))
+    assert replies[-1] == "OK"
+    assert player.moves == [112]
+    expected = GomokuState()
+    expected.makeMove(112)
+    assert (player.state.pieces1, player.state.pieces2) == (expected.pieces1, expected.pieces2)
+    assert player.state.currentPlayer == 2
+    assert player.node.state.pieces1 == expected.pieces1
+    # Without a memory limit the tree keeps the full table
+    assert player.table.capacity == TABLE_CAPACITY
+
+    player.run(iter(["TAKEBACK 7,7"]))
+    assert replies[-1] == "OK"
+    assert player.moves == []
+    assert not player.state.pieces1 | player.state.pieces2
@@ -0,0 +1,85 @@
+# Local imports
+from gomoku.ai.mcts import BOARD_SIZE, GomokuState, forbiddenMove
+# Module imports
+import random
+
+# Random games played under each set of rules
+GAMES = 300
+
+def playRandomGame(renju, seed):
+    # Yields the state and the move after every move of a random game
+    random.seed(seed)
+    state = GomokuState(renju)
+    while not state.isTerminal():
+        move = state.explore()
+        if move is None:
+            return
+        yield state, move
+
+def checkGames(renju):
+    wins = 0
+    for seed in range(GAMES):
+        for state, move in playRandomGame(renju, seed):
+            # The player who moved, as makeMove has flipped the player
+            if state.currentPlayer == 2:
+                pieces = state.pieces1
+            else:
+                pieces = state.pieces2
+            won = state.checkMoveWin(pieces, move)
+            assert won == state.checkPiecesWin(pieces), (seed, move)
+            assert won == (state.overallWinner is not None), (seed, move)
+            wins += won
+    # Most random games end with a five rather than a full board
+    assert wins > GAMES // 2
+
+def testCheckMoveWinFreestyle():
+    checkGames(False)
+
+def testCheckMoveWinRenju():
+    checkGames(True)
+
+def cells(*points):
+    # Bitboard of (x, y) points
+    return sum(1 << (BOARD_SIZE*y + x) for x, y in points)
+
+def isForbidden(black, move, white=()):
+    return forbiddenMove(cells(*black), cells(*white), BOARD_SIZE*move[1] + move[0])
+
+def testForbiddenDoubleThree():
+    # Open threes across and down through the move
+    black = [(8, 7), (9, 7), (7, 8), (7, 9)]
+    assert isForbidden(black, (7, 7))
+    # Blocking one end leaves a single three
+    assert not isForbidden(black, (7, 7), [(10, 7)])
+
+def testForbiddenFalseThree():
+    # The split three across only becomes a straight four at (6, 7),
+    # which makes an overline down column 6, so it is not a real
+    # three and the move only makes one three
+    black = [(5, 7), (8, 7), (7, 8), (7, 9), (6, 4), (6, 5), (6, 6), (6, 8), (6, 9)]
+    assert isForbidden(black, (6, 7))
+    assert not isForbidden(black, (7, 7))
+    # Without (6, 4), (6, 7) makes exactly five and the three is real
+    black.remove((6, 4))
+    assert not isForbidden(black, (6, 7))
+    assert isForbidden(black, (7, 7))
+
+def testForbiddenDoubleFourInLine():
+    # X_XXX_X makes five at either gap, two fours in one line
+    black = [(3, 7), (5, 7), (7, 7), (9, 7)]
+    assert isForbidden(black, (6, 7))
+    # With one end blocked it is a single four
+    assert not isForbidden(black[1:], (6, 7))
+
+def testForbiddenOverline():
+    black = [(2, 7), (3, 7), (4, 7), (6, 7), (7, 7)]
+    assert isForbidden(black, (5, 7))
+    # Exactly five is allowed
+    assert not isForbidden(black[1:], (5, 7))
+
+def testFiveAllowedWithForbiddenShape():
+    # Completes five across while also making a double three
+    black = [(3, 7), (4, 7), (5, 7), (6, 7), (7, 8), (7, 9), (8, 8), (9, 9)]
+    assert not isForbidden(black, (7, 7))
+    # The same double three without the five is forbidden
+    assert isForbidden(black[4:], (7, 7))
@@ -0,0 +1,34 @@
+# Local imports
+from gomoku.store import GameStore, GameRecord, GAME_HEADER
+# Module imports
+from array import array
+import os
+
+def makeGame(length, winner=1):
+    return GameRecord([112 + i for i in range(length)], winner, played=0)
+
+def testReopenAfterPartialWrites(tmp_path):
+    path = str(tmp_path / "games")
+    store = GameStore(path)
+    store.extend([makeGame(9), makeGame(10, 2), makeGame(11)])
+    store.close()
+
+    # A game cut off part way through its moves, indexed, followed
+    # by part of another offset, as left by stopping mid-write
+    end = os.path.getsize(path + ".dat")
+    with open(path + ".dat", "ab") as f:
+        f.write(makeGame(20).encode()[:GAME_HEADER.size + 5])
+    with open(path + ".idx", "ab") as f:
+        f.write(array("Q", [end]).tobytes() + b"\x01\x02\x03")
+
+    store = GameStore(path)
+    assert len(store) == 3
+    assert store[2].moves == makeGame(11).moves
+    assert store.append(makeGame(12)) == 3
+    assert store[3].moves == makeGame(12).moves
+    store.close()
+
+    store = GameStore(path)
+    assert len(store) == 4
+    assert [len(game.moves) for game in store.games()] == [9, 10, 11, 12]
+    store.close()